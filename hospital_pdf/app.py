@@ -1,12 +1,18 @@
-from flask import Flask, request, send_file, jsonify
+import json
+from flask import Flask, request, send_file, jsonify, Response, stream_with_context
 from flask_cors import CORS
-from functions.combinePDF import combine_pdfs
+from functions.combinePDF import iter_merged_pdf
 from io import BytesIO
 from functions.video_intake import process_surgical_video
-from functions.conversation_intake import process_compliance_requirements, test_compliance_processing
-from functions.supabase_functions.checklist_update import update_requirement_status
-from functions.after_action_report.generate_report import run_report_generation
-from functions.preprocessing.analyzePreSurgery import analyze_pre_surgery_compliance, load_and_encode_images, update_supabase
+from functions.conversation_intake import process_compliance_requirements, test_compliance_processing, find_compliance_tracker
+from functions.conversation_session import create_session, close_session, process_utterances
+from functions.supabase_functions.checklist_update import update_requirement_status, update_requirement_statuses
+from functions.supabase_functions.client_pool import get_pool_stats
+from functions.llm_cache import get_llm_cache
+from functions.after_action_report.report_jobs import get_report_queue, QueueFullError
+from functions.after_action_report.report_cache import get_report_cache
+from functions.preprocessing.analyzePreSurgery import analyze_pre_surgery_compliance, analysis_status, encode_uploaded_images, update_supabase, get_latest_preprocessing
+from functions.preprocessing.image_prep import image_prep_stats
 import os
 
 app = Flask(__name__)
@@ -27,7 +33,7 @@ def process_conversation():
         print(f"Received conversation text: {conversation_text[:100]}...") # Debug log
         
         try:
-            results = test_compliance_processing(conversation_text)
+            results = test_compliance_processing(conversation_text, data.get('surgery_id'))
             print(f"Processing results: {results}") # Debug log
             if results is None:
                 return jsonify({'error': 'Processing failed - received None result'}), 500
@@ -43,6 +49,59 @@ def process_conversation():
         print(error_msg)
         return jsonify({'error': error_msg}), 500
 
+@app.route('/sessions', methods=['POST'])
+def open_session():
+    """
+    Endpoint to open a streaming conversation session
+    """
+    data = request.get_json(silent=True) or {}
+    session = create_session(data.get('surgery_id'))
+    return jsonify(session.get_stats()), 201
+
+@app.route('/sessions/<session_id>/utterances', methods=['POST'])
+def append_utterances(session_id):
+    """
+    Endpoint to append utterances to a session and evaluate its sliding window
+    """
+    try:
+        data = request.get_json()
+        
+        if not data or not (data.get('utterance') or data.get('utterances')):
+            return jsonify({'error': 'An utterance or list of utterances is required'}), 400
+            
+        utterances = data.get('utterances') or [data.get('utterance')]
+        
+        try:
+            results = process_utterances(session_id, utterances, data.get('evaluate', True))
+        except KeyError:
+            return jsonify({'error': f'Unknown session: {session_id}'}), 404
+            
+        return jsonify({'results': results})
+        
+    except Exception as e:
+        error_msg = f"Error in append_utterances: {str(e)}"
+        print(error_msg)
+        return jsonify({'error': error_msg}), 500
+
+@app.route('/sessions/<session_id>', methods=['DELETE'])
+def end_session(session_id):
+    """
+    Endpoint to close a streaming conversation session
+    """
+    if not close_session(session_id):
+        return jsonify({'error': f'Unknown session: {session_id}'}), 404
+    return jsonify({'success': True})
+
+@app.route('/compliance-stats/<surgery_id>', methods=['GET'])
+def compliance_stats(surgery_id):
+    """
+    Endpoint exposing requirements skipped vs evaluated for an incremental surgery
+    """
+    tracker = find_compliance_tracker(surgery_id)
+    if tracker is None:
+        return jsonify({'error': f'No compliance tracking for surgery: {surgery_id}'}), 404
+    return jsonify(tracker.get_stats())
+
 @app.route('/update-requirement', methods=['POST', 'OPTIONS'])
 def update_requirement():
     """
@@ -86,29 +145,197 @@ def update_requirement():
         print(error_msg)
         return jsonify({'error': error_msg}), 500
 
+@app.route('/update-requirements', methods=['POST', 'OPTIONS'])
+def update_requirements():
+    """
+    Endpoint to mark several requirements as completed in one database write
+    """
+    if request.method == 'OPTIONS':
+        response = jsonify({'status': 'ok'})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+        response.headers.add('Access-Control-Allow-Methods', 'POST')
+        return response
+
+    try:
+        data = request.get_json()
+        
+        if not data or not isinstance(data.get('requirements'), list):
+            return jsonify({'error': 'A list of requirements is required'}), 400
+            
+        requirements = data.get('requirements')
+        print(f"Received bulk update request for {len(requirements)} requirements")
+        
+        updated = update_requirement_statuses(requirements)
+        
+        if updated is None:
+            response = jsonify({
+                'success': False,
+                'error': 'Failed to update requirements'
+            }), 500
+            response[0].headers.add('Access-Control-Allow-Origin', '*')
+            return response
+            
+        response = jsonify({
+            'success': True,
+            'updated': updated,
+            'unchanged': [req for req in requirements if req not in updated]
+        })
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+            
+    except Exception as e:
+        error_msg = f"Error in update_requirements: {str(e)}"
+        print(error_msg)
+        return jsonify({'error': error_msg}), 500
+
+@app.route('/supabase-pool-stats', methods=['GET'])
+def supabase_pool_stats():
+    """
+    Endpoint exposing Supabase connection reuse counters
+    """
+    return jsonify(get_pool_stats())
+
+@app.route('/llm-cache-stats', methods=['GET'])
+def llm_cache_stats():
+    """
+    Endpoint exposing LLM response cache hit/miss counters
+    """
+    return jsonify(get_llm_cache().get_stats())
+
+@app.route('/report-cache-stats', methods=['GET'])
+def report_cache_stats():
+    """
+    Endpoint exposing report PDF cache hit/miss/eviction counters
+    """
+    return jsonify(get_report_cache().get_stats())
+
+@app.route('/combine-pdfs', methods=['POST'])
+def combine_pdfs_endpoint():
+    """
+    Endpoint to merge uploaded PDFs, streaming the result back as it is written
+    """
+    pdfs = [f for f in request.files.getlist('pdfs') if f.filename]
+    if len(pdfs) < 2:
+        return jsonify({'error': 'At least two PDFs are required'}), 400
+        
+    print(f"Received {len(pdfs)} PDFs to combine")
+    return Response(
+        stream_with_context(iter_merged_pdf([pdf.stream for pdf in pdfs])),
+        mimetype='application/pdf',
+        headers={'Content-Disposition': 'attachment; filename=combined.pdf'}
+    )
+
+# Longest a client may block on GET /reports/<id>?wait=...
+MAX_REPORT_WAIT_SECONDS = 60
+
 @app.route('/generate-report', methods=['POST'])
 def generate_report():
     """
-    Endpoint to generate post-surgery report
+    Endpoint to queue post-surgery report generation; poll /reports/<id> for the result,
+    or follow /reports/<id>/events for per-section progress
     """
     try:
-        output_path = run_report_generation()
-        
-        if output_path and os.path.exists(output_path):
-            return send_file(
-                output_path,
-                mimetype='application/pdf',
-                as_attachment=True,
-                download_name='post_surgery_report.pdf'
-            )
-        else:
-            return jsonify({'error': 'Failed to generate report'}), 500
-            
+        params = request.get_json(silent=True) or {}
+        job, created = get_report_queue().submit(params)
+        
+        response = jsonify(dict(
+            job.to_dict(),
+            status_url=f"/reports/{job.id}",
+            events_url=f"/reports/{job.id}/events"
+        ))
+        return response, 202 if created else 200
+        
+    except QueueFullError as e:
+        response = jsonify({'error': f'Report queue is full: {str(e)}'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
     except Exception as e:
         error_msg = f"Error in generate_report: {str(e)}"
         print(error_msg)
         return jsonify({'error': error_msg}), 500
 
+@app.route('/reports/<job_id>', methods=['GET'])
+def report_status(job_id):
+    """
+    Endpoint to poll (or long-poll with ?wait=<seconds>) a report job
+    """
+    wait = min(request.args.get('wait', 0, type=float), MAX_REPORT_WAIT_SECONDS)
+    queue = get_report_queue()
+    job = queue.wait(job_id, wait) if wait > 0 else queue.get(job_id)
+    
+    if job is None:
+        return jsonify({'error': f'Unknown report job: {job_id}'}), 404
+        
+    status = job.to_dict()
+    if job.status == 'done':
+        status['download_url'] = f"/reports/{job.id}/download"
+    return jsonify(status)
+
+# Idle interval between keep-alive comments on /reports/<id>/events
+REPORT_EVENTS_KEEPALIVE_SECONDS = 15
+
+@app.route('/reports/<job_id>/events', methods=['GET'])
+def report_events(job_id):
+    """
+    Endpoint streaming a report job's progress as server-sent events
+    """
+    queue = get_report_queue()
+    job = queue.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown report job: {job_id}'}), 404
+
+    def events():
+        version = None
+        while True:
+            job = queue.wait_for_change(job_id, version, REPORT_EVENTS_KEEPALIVE_SECONDS)
+            if job is None:
+                return
+            if job.version == version:
+                yield ": keep-alive\n\n"
+                continue
+
+            version = job.version
+            status = job.to_dict()
+            if job.is_finished:
+                if job.status == 'done':
+                    status['download_url'] = f"/reports/{job.id}/download"
+                yield f"event: {job.status}\ndata: {json.dumps(status)}\n\n"
+                return
+            yield f"event: progress\ndata: {json.dumps(status)}\n\n"
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/reports/<job_id>/download', methods=['GET'])
+def download_report(job_id):
+    """
+    Endpoint to download a finished report
+
+    The ETag is the digest of the report's inputs, so reviewers revalidating with
+    If-None-Match get a 304 until the underlying data changes.
+    """
+    job = get_report_queue().get(job_id)
+    
+    if job is None:
+        return jsonify({'error': f'Unknown report job: {job_id}'}), 404
+    if job.status != 'done':
+        return jsonify({'error': f'Report is not ready (status: {job.status})'}), 409
+    if not job.output_path or not os.path.exists(job.output_path):
+        return jsonify({'error': 'Report file is no longer available'}), 410
+        
+    return send_file(
+        os.path.abspath(job.output_path),
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name='post_surgery_report.pdf',
+        etag=job.digest or True,
+        conditional=True
+    )
+
 @app.route('/analyze-pre-surgery', methods=['POST'])
 def analyze_pre_surgery():
     """
@@ -125,58 +352,54 @@ def analyze_pre_surgery():
 
         print(f"Received {len(images)} images for analysis")
         
-        # Create temporary directory with absolute path
-        temp_dir = os.path.abspath("temp_pre_surgery_images")
-        if not os.path.exists(temp_dir):
-            os.makedirs(temp_dir)
-            print(f"Created temporary directory at: {temp_dir}")
-            
-        try:
-            # Save uploaded images temporarily
-            image_paths = []
-            for img in images:
-                if img.filename:
-                    # Sanitize filename
-                    safe_filename = os.path.basename(img.filename)
-                    temp_path = os.path.join(temp_dir, safe_filename)
-                    img.save(temp_path)
-                    image_paths.append(temp_path)
-                    print(f"Saved image to {temp_path}")
-
-            # Process the images
-            encoded_images = load_and_encode_images(temp_dir)
-            if not encoded_images:
-                return jsonify({'error': 'Failed to process images'}), 500
-
-            # Analyze the images
-            analysis = analyze_pre_surgery_compliance(encoded_images)
-            if not analysis:
-                return jsonify({'error': 'Failed to analyze images'}), 500
-
-            # Update Supabase with results
-            update_result = update_supabase(analysis)
-            if not update_result:
-                return jsonify({'error': 'Failed to update database'}), 500
-
-            return jsonify({
-                'success': True,
-                'analysis': analysis
-            })
-
-        finally:
-            # Clean up temporary files
-            for path in image_paths:
-                if os.path.exists(path):
-                    os.remove(path)
-                    print(f"Removed temporary file: {path}")
-            if os.path.exists(temp_dir):
-                os.rmdir(temp_dir)
-                print(f"Removed temporary directory: {temp_dir}")
+        # Encode straight from the upload streams; each request keeps its own images.
+        # Uploads that aren't decodable images are left out and listed in the response
+        rejected = []
+        encoded_images = encode_uploaded_images(images, rejected=rejected)
+        if not encoded_images:
+            return jsonify({'error': 'No readable images provided', 'rejected_uploads': rejected}), 400
+
+        # Form fields room_id and surgery_id are optional
+        room_id = request.form.get('room_id')
+        surgery_id = request.form.get('surgery_id')
+
+        # Analyze the images
+        timings = {}
+        analysis = analyze_pre_surgery_compliance(encoded_images, timings=timings,
+                                                  room_id=room_id, surgery_id=surgery_id)
+        if not analysis:
+            return jsonify({'error': 'Failed to analyze images'}), 500
+
+        # Record the results for this room
+        update_result = update_supabase(analysis, room_id=room_id, surgery_id=surgery_id)
+        if not update_result:
+            return jsonify({'error': 'Failed to update database'}), 500
+
+        # 'partial' is set when some image groups failed and the analysis covers only the rest;
+        # 'failed_groups' lists those groups by the upload positions of their images
+        return jsonify({
+            'success': True,
+            'analysis': analysis,
+            **analysis_status(timings),
+            'rejected_uploads': rejected,
+            'preprocessing': image_prep_stats(encoded_images),
+            'timings': timings
+        })
 
     except Exception as e:
         error_msg = f"Error in analyze_pre_surgery: {str(e)}"
         print(error_msg)
         return jsonify({'error': error_msg}), 500
 
+@app.route('/preprocessing/latest', methods=['GET'])
+def latest_preprocessing():
+    """
+    Endpoint returning the latest pre-surgery analysis per room (optionally ?room_id=)
+    """
+    rows = get_latest_preprocessing(request.args.get('room_id'))
+    if rows is None:
+        return jsonify({'error': 'Failed to fetch preprocessing results'}), 500
+    return jsonify(rows)
+
 if __name__ == '__main__':
     app.run(debug=True, port=5001)
\ No newline at end of file
@@ -0,0 +1,162 @@
+import os
+import re
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+from functions.llm_cache import RateLimiter
+from .collect_data import collect_post_surgery_report_data, synthesize_post_surgery_report
+from .report_template import render_report_file
+
+REPORTS_DIR = "generated_reports"
+# Surgeries collected and synthesized at once
+LLM_CONCURRENCY = int(os.getenv('BULK_REPORT_LLM_CONCURRENCY', '4'))
+# OpenAI calls started per minute across the whole run
+LLM_REQUESTS_PER_MINUTE = float(os.getenv('BULK_REPORT_RPM', '60'))
+
+# Render workers are spawned rather than forked: forking while LLM threads hold
+# locks can deadlock the child, and rendering only needs reportlab
+_RENDER_CONTEXT = multiprocessing.get_context('spawn')
+
+_UNSAFE_FILENAME_CHARS = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+def report_path(surgery_id, output_dir: str = REPORTS_DIR) -> str:
+    """Deterministic output path of a surgery's report."""
+    safe_id = _UNSAFE_FILENAME_CHARS.sub('_', str(surgery_id))
+    return os.path.join(output_dir, f"post_surgery_report_{safe_id}.pdf")
+
+
+def _synthesize(surgery_id, limiter: RateLimiter) -> Dict:
+    """Collect and synthesize one surgery's report text on a worker thread."""
+    result = {'surgery_id': surgery_id, 'timings': {}}
+
+    stage_start = time.perf_counter()
+    collected_data = collect_post_surgery_report_data(surgery_id)
+    result['timings']['collect'] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    result['report'] = synthesize_post_surgery_report(collected_data, limiter=limiter) if collected_data else None
+    result['timings']['synthesize'] = time.perf_counter() - stage_start
+    return result
+
+
+def run_bulk_reports(surgery_ids: List, output_dir: str = REPORTS_DIR,
+                     render_workers: Optional[int] = None,
+                     llm_concurrency: int = LLM_CONCURRENCY,
+                     requests_per_minute: float = LLM_REQUESTS_PER_MINUTE) -> Dict:
+    """
+    Generate a report for each surgery.
+
+    Data collection and synthesis run on a thread pool with every OpenAI call
+    going through one rate limiter. Each synthesized report is handed to a
+    process pool for rendering as soon as it is ready, so reportlab's CPU work
+    overlaps with the remaining LLM calls.
+
+    Args:
+        surgery_ids (List): Surgeries to report on; duplicates are ignored
+        output_dir (str): Directory for post_surgery_report_<surgery_id>.pdf files
+        render_workers (int, optional): Rendering processes (defaults to the CPU count)
+        llm_concurrency (int): Surgeries collected and synthesized at once
+        requests_per_minute (float): OpenAI calls started per minute across the run
+
+    Returns:
+        Dict: Per-report results plus totals, wall time and throughput
+    """
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    surgery_ids = list(dict.fromkeys(surgery_ids))
+    limiter = RateLimiter(requests_per_minute)
+    results = []
+
+    with ThreadPoolExecutor(max_workers=llm_concurrency, thread_name_prefix='bulk-report') as llm_pool, \
+            ProcessPoolExecutor(max_workers=render_workers, mp_context=_RENDER_CONTEXT) as render_pool:
+        synth_futures = {llm_pool.submit(_synthesize, sid, limiter): sid for sid in surgery_ids}
+        render_futures = {}
+
+        for future in as_completed(synth_futures):
+            surgery_id = synth_futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'surgery_id': surgery_id, 'timings': {}, 'report': None, 'error': str(e)}
+
+            report = result.pop('report', None)
+            if not report:
+                result.setdefault('error', 'Failed to synthesize report')
+                result['status'] = 'failed'
+                results.append(result)
+                print(f"[failed] {surgery_id}: {result['error']}")
+                continue
+
+            result['output'] = report_path(surgery_id, output_dir)
+            render_futures[render_pool.submit(render_report_file, report, result['output'])] = result
+
+        for future in as_completed(render_futures):
+            result = render_futures[future]
+            try:
+                rendered = future.result()
+                result['timings']['render'] = rendered['seconds']
+                result['status'] = 'done' if rendered['success'] else 'failed'
+                if not rendered['success']:
+                    result['error'] = 'Failed to generate PDF report'
+            except Exception as e:
+                result['status'] = 'failed'
+                result['error'] = str(e)
+
+            result['seconds'] = sum(result['timings'].values())
+            results.append(result)
+            print(f"[{result['status']}] {result['surgery_id']} -> {result['output']} ({result['seconds']:.1f}s)")
+
+    elapsed = time.perf_counter() - start
+    done = sum(1 for r in results if r['status'] == 'done')
+
+    return {
+        'reports': results,
+        'done': done,
+        'failed': len(results) - done,
+        'seconds': elapsed,
+        'reports_per_minute': done * 60 / elapsed if elapsed else 0.0,
+        'rate_limit_wait_seconds': limiter.waited
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate post-surgery reports for many surgeries.')
+    parser.add_argument('surgery_ids', nargs='*', help='Surgery ids to report on')
+    parser.add_argument('--ids-file', help='File with one surgery id per line')
+    parser.add_argument('--output-dir', default=REPORTS_DIR, help='Directory for the generated PDFs')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Rendering processes (default: CPU count)')
+    parser.add_argument('--llm-concurrency', type=int, default=LLM_CONCURRENCY,
+                        help='Surgeries collected and synthesized at once')
+    parser.add_argument('--rpm', type=float, default=LLM_REQUESTS_PER_MINUTE,
+                        help='Maximum OpenAI requests started per minute')
+
+    args = parser.parse_args()
+
+    surgery_ids = list(args.surgery_ids)
+    if args.ids_file:
+        with open(args.ids_file, 'r', encoding='utf-8') as f:
+            surgery_ids.extend(line.strip() for line in f if line.strip())
+    if not surgery_ids:
+        parser.error('at least one surgery id (or --ids-file) is required')
+
+    summary = run_bulk_reports(surgery_ids, args.output_dir, args.workers, args.llm_concurrency, args.rpm)
+
+    print("-" * 50)
+    for result in sorted(summary['reports'], key=lambda r: str(r['surgery_id'])):
+        stages = "  ".join(f"{stage}={seconds:.1f}s" for stage, seconds in result['timings'].items())
+        print(f"{result['surgery_id']}: {result['status']}  {stages}")
+    print(f"Done: {summary['done']}  Failed: {summary['failed']}")
+    print(f"Total time: {summary['seconds']:.1f}s ({summary['reports_per_minute']:.1f} reports/min, "
+          f"{summary['rate_limit_wait_seconds']:.1f}s waiting on the rate limit)")
+
+    if summary['failed']:
+        exit(1)
+
+if __name__ == "__main__":
+    # Run from hospital_pdf/: python -m functions.after_action_report.bulk_reports <surgery ids...>
+    main()
@@ -2,9 +2,12 @@
 import requests
 import json
 import openai
-from functions.supabase_functions.supabaseFunctions import get_all_requirements, initialize_supabase
+from functions.supabase_functions.supabaseFunctions import get_all_requirements
+from functions.supabase_functions.client_pool import get_supabase_client
+from functions.llm_cache import cached_completion, stream_cached_completion
 from openai import OpenAI
 import os
+from concurrent.futures import ThreadPoolExecutor, wait
 
 # Initialize OpenAI client
 client = OpenAI()  # This will automatically use OPENAI_API_KEY from environment
@@ -33,30 +36,109 @@ def get_checklist_performance():
         print(f"Error fetching checklist performance data: {e}")
         return None
 
-def get_supabase_vision_data_interpretations():
+# Report readers fetch one surgery's rows, page by page, up to a per-source row budget
+PAGE_SIZE = 500
+DEFAULT_ROW_BUDGET = int(os.getenv('REPORT_ROW_BUDGET', '1000'))
+SURGERY_ID_COLUMN = 'surgery_id'
+
+# Columns sent to the report. Tables whose schema isn't defined in this repo default
+# to every column; narrow them with REPORT_COLUMNS_<TABLE>, e.g. REPORT_COLUMNS_ALERTS
+SOURCE_COLUMNS = {
+    'surgery_data': '*',
+    'alerts': '*',
+    'preprocessing': 'id,room_id,description,created_at',
+    'preprocessing_latest': 'id,room_id,description,created_at'
+}
+
+def _source_columns(table):
+    columns = os.getenv(f"REPORT_COLUMNS_{table.upper()}", SOURCE_COLUMNS.get(table, '*'))
+    # Keyset pagination needs the id column
+    if columns != '*' and 'id' not in columns.split(','):
+        columns = f"id,{columns}"
+    return columns
+
+def iter_table_rows(table, surgery_id=None, row_budget=DEFAULT_ROW_BUDGET, page_size=PAGE_SIZE):
+    """
+    Stream the most recent rows of a table, newest first.
+
+    Args:
+        table (str): Table to read
+        surgery_id (optional): Only read rows of this surgery
+        row_budget (int): Maximum number of rows to yield
+        page_size (int): Rows fetched per request
+
+    Yields:
+        dict: One row at a time, projected to the table's configured columns
+    """
+    supabase = get_supabase_client()
+    columns = _source_columns(table)
+    fetched = 0
+    last_id = None
+
+    while fetched < row_budget:
+        limit = min(page_size, row_budget - fetched)
+        query = supabase.table(table).select(columns)
+        if surgery_id is not None:
+            query = query.eq(SURGERY_ID_COLUMN, surgery_id)
+        if last_id is not None:
+            # Keyset pagination: cost per page doesn't grow with the offset
+            query = query.lt('id', last_id)
+        rows = query.order('id', desc=True).limit(limit).execute().data
+
+        for row in rows:
+            yield row
+        fetched += len(rows)
+        if len(rows) < limit:
+            break
+        last_id = rows[-1]['id']
+
+def _recent_rows(table, surgery_id, row_budget, truncated=None):
+    """
+    Read the newest row_budget rows of a table into memory, oldest first.
+
+    The report digest and prompt need each source as a whole, so the rows are
+    materialized here; row_budget is what bounds memory. When the table has more
+    rows than the budget, the older ones are left out with a warning and the
+    table is appended to truncated (if given).
+    """
+    # One row past the budget tells a full table from one that was cut short
+    rows = list(iter_table_rows(table, surgery_id, row_budget + 1))
+    if len(rows) > row_budget:
+        rows = rows[:row_budget]
+        scope = f" for surgery {surgery_id}" if surgery_id is not None else ""
+        print(f"Warning: '{table}' has more than {row_budget} rows{scope}; "
+              f"only the newest {row_budget} are included")
+        if truncated is not None:
+            truncated.append(table)
+    rows.reverse()
+    return rows
+
+def get_supabase_vision_data_interpretations(surgery_id=None, row_budget=DEFAULT_ROW_BUDGET, truncated=None):
     """
     Retrieve vision data interpretations from the 'surgery_data' table.
+
+    Loads at most row_budget rows into memory, in chronological order; see _recent_rows.
     """
     try:
         print("Fetching vision data interpretations from 'surgery_data' table...")
-        supabase = initialize_supabase()
-        response = supabase.table('surgery_data').select('*').execute()
-        print("Vision data interpretations fetched successfully.")
-        return response.data
+        data = _recent_rows('surgery_data', surgery_id, row_budget, truncated)
+        print(f"Vision data interpretations fetched successfully ({len(data)} rows).")
+        return data
     except Exception as e:
         print(f"Error fetching vision data interpretations: {e}")
         return None
 
-def get_live_surgeon_metrics():
+def get_live_surgeon_metrics(surgery_id=None, row_budget=DEFAULT_ROW_BUDGET, truncated=None):
     """
     Retrieve live surgeon metrics data from the 'alerts' table.
+
+    Loads at most row_budget rows into memory, in chronological order; see _recent_rows.
     """
     try:
         print("Fetching live surgeon metrics data from 'alerts' table...")
-        supabase = initialize_supabase()
-        response = supabase.table('alerts').select('*').execute()
-        print("Live surgeon metrics data fetched successfully.")
-        return response.data
+        data = _recent_rows('alerts', surgery_id, row_budget, truncated)
+        print(f"Live surgeon metrics data fetched successfully ({len(data)} rows).")
+        return data
     except Exception as e:
         print(f"Error fetching live surgeon metrics data: {e}")
         return None
@@ -68,78 +150,351 @@ def get_audio_analysis():
     # TODO: Implement this function
     return None
 
-def get_preprocessing_data():
+def get_preprocessing_data(surgery_id=None, row_budget=DEFAULT_ROW_BUDGET, truncated=None):
     """
     Retrieve preprocessing data from the 'preprocessing' table.
+
+    The table is append-only per room, so without a surgery the latest analysis
+    of each room is read from the 'preprocessing_latest' view. Loads at most
+    row_budget rows into memory, in chronological order; see _recent_rows.
     """
     try:
         print("Fetching preprocessing data from 'preprocessing' table...")
-        supabase = initialize_supabase()
-        response = supabase.table('preprocessing').select('*').execute()
-        print("Preprocessing data fetched successfully.")
-        return response.data
+        table = 'preprocessing' if surgery_id is not None else 'preprocessing_latest'
+        data = _recent_rows(table, surgery_id, row_budget, truncated)
+        print(f"Preprocessing data fetched successfully ({len(data)} rows).")
+        return data
     except Exception as e:
         print(f"Error fetching preprocessing data: {e}")
         return None
 
-def collect_post_surgery_report_data():
+# The sources are independent reads, so they are fetched in parallel over the pooled client
+SOURCE_TIMEOUT_SECONDS = 15
+
+# Sources scoped to a surgery and bounded by a row budget
+SCOPED_REPORT_SOURCES = {
+    "visionInterpretations": get_supabase_vision_data_interpretations,
+    "liveSurgeonMetrics": get_live_surgeon_metrics,
+    "preprocessingData": get_preprocessing_data
+}
+
+def collect_post_surgery_report_data(surgery_id=None, row_budget=DEFAULT_ROW_BUDGET, timeout=SOURCE_TIMEOUT_SECONDS):
     """
     Collect data from various sources and compile it into one JSON object
     intended to be fed to OpenAI for post surgery report generation.
+
+    Sources are fetched concurrently. A source that fails or takes longer than
+    timeout seconds is reported as None and listed under "unavailableSources".
+    Scoped sources hold at most row_budget rows each, oldest first; sources cut
+    short by the budget are listed under "truncatedSources".
+
+    Args:
+        surgery_id (optional): Only collect rows of this surgery
+        row_budget (int): Maximum rows read from each scoped source
+        timeout (float): Seconds to wait for the sources
+
+    Returns:
+        dict: The collected sources, or None if every source was unavailable
     """
     print("Starting data collection for post surgery report...")
 
-    checklist_data = get_checklist_performance()
-    vision_data = get_supabase_vision_data_interpretations()
-    live_metrics_data = get_live_surgeon_metrics()
-    preprocessing_data = get_preprocessing_data()
+    # One thread per source for this call only, so every source starts right away:
+    # the timeout never includes time queued behind other reports' reads
+    pool = ThreadPoolExecutor(max_workers=len(SCOPED_REPORT_SOURCES) + 1, thread_name_prefix='report-collect')
+    futures = {"checklistPerformance": pool.submit(get_checklist_performance)}
+    truncated_tables = {name: [] for name in SCOPED_REPORT_SOURCES}
+    for name, fetch in SCOPED_REPORT_SOURCES.items():
+        futures[name] = pool.submit(fetch, surgery_id, row_budget, truncated_tables[name])
+    wait(futures.values(), timeout=timeout)
+    # Reads still running can't be interrupted; they finish in the background
+    # and their results are dropped
+    pool.shutdown(wait=False)
+
+    report_data = {}
+    unavailable = []
+    for name, future in futures.items():
+        if not future.done():
+            print(f"Timed out fetching {name} after {timeout}s")
+            report_data[name] = None
+        else:
+            report_data[name] = future.result()
+        if report_data[name] is None:
+            unavailable.append(name)
 
-    report_data = {
-        "checklistPerformance": checklist_data,
-        "visionInterpretations": vision_data,
-        "liveSurgeonMetrics": live_metrics_data,
-        "preprocessingData": preprocessing_data
-    }
+    if len(unavailable) == len(futures):
+        print("Every report source was unavailable; nothing to report on.")
+        return None
+    if unavailable:
+        report_data["unavailableSources"] = unavailable
+    truncated = [name for name, tables in truncated_tables.items() if tables and report_data[name] is not None]
+    if truncated:
+        report_data["truncatedSources"] = truncated
 
-    print("Data collection complete.")
+    print(f"Data collection complete ({len(futures) - len(unavailable)}/{len(futures)} sources).")
     return report_data
 
-def synthesize_post_surgery_report():
+REPORT_SYSTEM_ROLE = "You are a medical report synthesis assistant. Your task is to generate a comprehensive post-surgery report based on the provided data."
+
+REPORT_INSTRUCTIONS = (
+    "The report should summarize checklist performance, vision data interpretations, and live surgeon metrics in a clear, concise, and professional manner.\n"
+    "The report should also generate a score assessment of the surgeon's performance based on the data."
+)
+
+# Token budgets are estimated at ~4 characters per token
+CHARS_PER_TOKEN = 4
+# Above this prompt size 'auto' mode switches from one call to map-reduce
+SINGLE_CALL_TOKEN_BUDGET = 60000
+# Input per map call, and output per map summary
+MAP_CHUNK_TOKEN_BUDGET = 12000
+MAP_SUMMARY_MAX_TOKENS = 600
+REDUCE_MAX_TOKENS = 4000
+# Summaries sent to the final reduce call; above this they are merged in extra reduce levels
+REDUCE_INPUT_TOKEN_BUDGET = 30000
+MAP_MODEL = "gpt-4o-mini"
+
+_synthesis_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='report-map')
+
+def _dump(data):
+    return json.dumps(data, separators=(',', ':'), default=str)
+
+def _chunk_source(data, budget_chars):
+    """Split a source into JSON chunks of at most roughly budget_chars each."""
+    if not isinstance(data, list):
+        return [_dump(data)]
+
+    chunks, current, size = [], [], 0
+    for row in data:
+        line = _dump(row)
+        if current and size + len(line) > budget_chars:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+def _summarize_chunk(source_name, chunk, part, parts, bypass_cache, limiter=None):
+    """Map step: condense one chunk of one source into the facts the report needs."""
+    prompt = (
+        f"Below is part {part} of {parts} of the '{source_name}' data from a surgery "
+        "(one JSON record per line).\n\n"
+        f"{chunk}\n\n"
+        "Summarize it for a post-surgery review. Keep every safety issue, alert, "
+        "deviation, missed checklist item, count and timestamp that matters. Be concise."
+    )
+    return cached_completion(
+        client,
+        bypass_cache=bypass_cache,
+        limiter=limiter,
+        model=MAP_MODEL,
+        max_tokens=MAP_SUMMARY_MAX_TOKENS,
+        messages=[
+            {"role": "system", "content": REPORT_SYSTEM_ROLE},
+            {"role": "user", "content": prompt}
+        ]
+    ).strip()
+
+def _merge_summaries(source_name, summaries, bypass_cache, limiter=None):
+    """Intermediate reduce step: condense consecutive summaries of one source into one."""
+    joined = "\n\n".join(summaries)
+    prompt = (
+        f"Below are {len(summaries)} consecutive summaries of the '{source_name}' data from a surgery, "
+        "oldest first.\n\n"
+        f"{joined}\n\n"
+        "Merge them into one summary for a post-surgery review. Keep every safety issue, alert, "
+        "deviation, missed checklist item, count and timestamp that matters. Be concise."
+    )
+    return cached_completion(
+        client,
+        bypass_cache=bypass_cache,
+        limiter=limiter,
+        model=MAP_MODEL,
+        max_tokens=MAP_SUMMARY_MAX_TOKENS,
+        messages=[
+            {"role": "system", "content": REPORT_SYSTEM_ROLE},
+            {"role": "user", "content": prompt}
+        ]
+    ).strip()
+
+def _batch_summaries(parts, budget_chars):
+    """Group consecutive summaries into batches of at most roughly budget_chars each."""
+    batches, current, size = [], [], 0
+    for part in parts:
+        if current and size + len(part) > budget_chars:
+            batches.append(current)
+            current, size = [], 0
+        current.append(part)
+        size += len(part) + 2
+    if current:
+        batches.append(current)
+    return batches
+
+def _reduce_summaries(summaries, bypass_cache=False, limiter=None):
+    """
+    Merge map summaries level by level until they fit the reduce input budget.
+
+    Each level batches the consecutive summaries of every source up to the map
+    chunk budget and condenses each batch of two or more in parallel.
+    """
+    budget_chars = REDUCE_INPUT_TOKEN_BUDGET * CHARS_PER_TOKEN
+    batch_chars = MAP_CHUNK_TOKEN_BUDGET * CHARS_PER_TOKEN
+    level = 1
+
+    while sum(len(part) for parts in summaries.values() for part in parts) > budget_chars:
+        level += 1
+        merged = {}
+        calls = 0
+        for name, parts in summaries.items():
+            merged[name] = []
+            for batch in _batch_summaries(parts, batch_chars):
+                if len(batch) == 1:
+                    merged[name].append(batch[0])
+                else:
+                    merged[name].append(_synthesis_pool.submit(_merge_summaries, name, batch, bypass_cache, limiter))
+                    calls += 1
+        if calls == 0:
+            print(f"Warning: summaries exceed the reduce budget of {REDUCE_INPUT_TOKEN_BUDGET} tokens "
+                  "but cannot be merged further")
+            break
+
+        print(f"Reduce level {level}: merging summaries in {calls} parallel calls...")
+        summaries = {
+            name: [part if isinstance(part, str) else part.result() for part in parts]
+            for name, parts in merged.items()
+        }
+
+    return summaries
+
+def _map_reduce_prompt(collected_data, bypass_cache=False, limiter=None):
+    """
+    Map step of hierarchical synthesis for large datasets.
+
+    Each source (split into chunks when large) is summarized in parallel map
+    calls. If the summaries together exceed REDUCE_INPUT_TOKEN_BUDGET they are
+    merged in further levels, and the result becomes the prompt for the single
+    reduce call.
+    """
+    budget_chars = MAP_CHUNK_TOKEN_BUDGET * CHARS_PER_TOKEN
+    unavailable = collected_data.get("unavailableSources", [])
+    truncated = collected_data.get("truncatedSources", [])
+
+    tasks = []
+    for name, data in collected_data.items():
+        if name in ("unavailableSources", "truncatedSources") or data is None:
+            continue
+        chunks = _chunk_source(data, budget_chars)
+        for part, chunk in enumerate(chunks, start=1):
+            tasks.append((name, part, _synthesis_pool.submit(
+                _summarize_chunk, name, chunk, part, len(chunks), bypass_cache, limiter
+            )))
+
+    print(f"Map step: summarizing {len(tasks)} chunks in parallel...")
+    summaries = {}
+    for name, part, future in tasks:
+        summaries.setdefault(name, []).append(future.result())
+    summaries = _reduce_summaries(summaries, bypass_cache, limiter)
+
+    sections = "\n\n".join(
+        f"### {name}\n" + "\n\n".join(parts) for name, parts in summaries.items()
+    )
+    if unavailable:
+        sections += f"\n\n(Data unavailable for: {', '.join(unavailable)})"
+    if truncated:
+        sections += f"\n\n(Only the most recent records were included for: {', '.join(truncated)})"
+
+    return (
+        "Synthesize the following summaries of post surgery data into a detailed and comprehensive report for medical review:\n\n"
+        f"{sections}\n\n"
+        f"{REPORT_INSTRUCTIONS}"
+    )
+
+def _report_request(collected_data, bypass_cache=False, mode='auto', limiter=None):
+    """Build the chat completion params for the final report call."""
+    data_json = _dump(collected_data)
+    if mode == 'auto':
+        mode = 'map_reduce' if len(data_json) > SINGLE_CALL_TOKEN_BUDGET * CHARS_PER_TOKEN else 'single'
+
+    params = {"model": "gpt-4o"}
+    if mode == 'map_reduce':
+        prompt = _map_reduce_prompt(collected_data, bypass_cache, limiter)
+        params["max_tokens"] = REDUCE_MAX_TOKENS
+        print("Reduce step: writing the final report...")
+    else:
+        # Create a detailed prompt containing the JSON data to guide the synthesis
+        prompt = (
+            "Synthesize the following post surgery data into a detailed and comprehensive report for medical review:\n\n"
+            f"{data_json}\n\n"
+            f"{REPORT_INSTRUCTIONS}"
+        )
+        print("Sending prompt to OpenAI ChatCompletion API...")
+
+    params["messages"] = [
+        {"role": "system", "content": REPORT_SYSTEM_ROLE},
+        {"role": "user", "content": prompt}
+    ]
+    return params
+
+def synthesize_post_surgery_report(collected_data=None, bypass_cache=False, surgery_id=None, mode='auto', limiter=None):
     """
     Synthesize the post-surgery report by feeding the collected data to the OpenAI API,
     which generates a detailed report.
+
+    Args:
+        collected_data (dict, optional): Output of collect_post_surgery_report_data.
+            Collected here when not provided.
+        bypass_cache (bool, optional): Always call the model instead of reusing a cached report
+        surgery_id (optional): Surgery to collect data for when collected_data isn't given
+        mode (str, optional): 'single' for one call over all data, 'map_reduce' for
+            per-source summaries plus a final call, or 'auto' to pick by data size
+        limiter (RateLimiter, optional): Shared limit on OpenAI calls, e.g. across a bulk run
     """
     print("Starting synthesis of post-surgery report via OpenAI API call...")
 
     # Collect the raw data
-    collected_data = collect_post_surgery_report_data()
+    if collected_data is None:
+        collected_data = collect_post_surgery_report_data(surgery_id)
     if collected_data is None:
         print("No data collected for the report. Exiting synthesis.")
         return None
 
-    # Create a detailed prompt containing the JSON data to guide the synthesis
-    prompt = (
-        "Synthesize the following post surgery data into a detailed and comprehensive report for medical review:\n\n"
-        f"{json.dumps(collected_data, indent=2)}\n\n"
-        "The report should summarize checklist performance, vision data interpretations, and live surgeon metrics in a clear, concise, and professional manner.\n"
-        "The report should also generate a score assessment of the surgeon's performance based on the data."
-    )
-
-    print("Sending prompt to OpenAI ChatCompletion API...")
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a medical report synthesis assistant. Your task is to generate a comprehensive post-surgery report based on the provided data."
-                },
-                {"role": "user", "content": prompt}
-            ]
-        )
-        synthesized_report = response.choices[0].message.content.strip()
+        params = _report_request(collected_data, bypass_cache, mode, limiter)
+        synthesized_report = cached_completion(client, bypass_cache=bypass_cache, limiter=limiter, **params)
+        synthesized_report = synthesized_report.strip()
         print("Post-surgery report synthesis complete.")
         return synthesized_report
     except Exception as e:
         print(f"Error during report synthesis: {e}")
         return None
+
+def iter_report_sections(deltas):
+    """Group streamed text into sections, yielding each one as soon as its blank line arrives."""
+    buffer = ""
+    for delta in deltas:
+        buffer += delta
+        while "\n\n" in buffer:
+            section, buffer = buffer.split("\n\n", 1)
+            if section.strip():
+                yield section.strip()
+    if buffer.strip():
+        yield buffer.strip()
+
+def stream_post_surgery_report(collected_data, bypass_cache=False, mode='auto'):
+    """
+    Streaming variant of synthesize_post_surgery_report.
+
+    The final report call is made with stream=True, so the first section is
+    available after a few seconds instead of after the whole synthesis.
+
+    Yields:
+        str: Report sections (paragraphs separated by blank lines), in order
+
+    Raises:
+        Exception: Errors from the OpenAI API are propagated to the consumer
+    """
+    print("Starting streamed synthesis of post-surgery report...")
+    params = _report_request(collected_data, bypass_cache, mode)
+    yield from iter_report_sections(
+        stream_cached_completion(client, bypass_cache=bypass_cache, **params)
+    )
@@ -1,176 +1,159 @@
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.units import inch
 import json
 from datetime import datetime
 from ..conversation_intake import test_compliance_processing
-from .collect_data import synthesize_post_surgery_report
+from .collect_data import collect_post_surgery_report_data, synthesize_post_surgery_report, stream_post_surgery_report
+from .report_template import get_report_template
+from .report_cache import report_inputs_digest
 import os
+import time
 import logging
 
 def create_section_header(text):
     """Create a styled section header"""
-    styles = getSampleStyleSheet()
-    header_style = ParagraphStyle(
-        'CustomHeader',
-        parent=styles['Heading1'],
-        fontSize=14,
-        spaceAfter=20,
-        textColor=colors.HexColor('#2E5A88')
-    )
-    return Paragraph(text, header_style)
+    return get_report_template().section_header(text)
 
 def create_content_paragraph(text):
     """Create a styled content paragraph"""
-    styles = getSampleStyleSheet()
-    content_style = ParagraphStyle(
-        'CustomContent',
-        parent=styles['Normal'],
-        fontSize=10,
-        leading=14,
-        spaceAfter=10
-    )
-    return Paragraph(text, content_style)
+    return get_report_template().content_paragraph(text)
 
 def format_data_table(data):
     """Format data into a table structure"""
-    if not data:
-        return None
-    
-    # Convert data to list of lists for table
-    table_data = [[k, str(v)] for k, v in data.items()]
-    
-    # Create table with styling
-    table = Table(table_data, colWidths=[2*inch, 4*inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#F5F5F5')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#2E5A88')),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#CCCCCC'))
-    ]))
-    return table
+    return get_report_template().data_table(data)
 
-def generate_pdf_report(report_data, output_path):
-    """Generate a PDF report from the synthesized data"""
-    print("Starting PDF generation...")
-    
-    # Create the PDF document
-    doc = SimpleDocTemplate(
-        output_path,
-        pagesize=letter,
-        rightMargin=72,
-        leftMargin=72,
-        topMargin=72,
-        bottomMargin=72
-    )
-    
-    # Initialize story (content elements)
-    story = []
-    
-    # Add title
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        spaceAfter=30,
-        textColor=colors.HexColor('#1B365D')
-    )
-    title = Paragraph("Post-Surgery Report", title_style)
-    story.append(title)
-    
-    # Add timestamp
-    timestamp = Paragraph(
-        f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
-        styles['Normal']
-    )
-    story.append(timestamp)
-    story.append(Spacer(1, 20))
-    
-    # Add synthesized report content
-    if isinstance(report_data, str):
-        # If report_data is a string, split it into sections
-        sections = report_data.split('\n\n')
-        for section in sections:
-            if section.strip():
-                story.append(create_content_paragraph(section))
-                story.append(Spacer(1, 10))
-    elif isinstance(report_data, dict):
-        # If report_data is a dictionary, process each section
-        for section_title, content in report_data.items():
-            story.append(create_section_header(section_title.replace('_', ' ').title()))
-            if isinstance(content, (dict, list)):
-                table = format_data_table(content if isinstance(content, dict) else {str(i): item for i, item in enumerate(content)})
-                if table:
-                    story.append(table)
-            else:
-                story.append(create_content_paragraph(str(content)))
-            story.append(Spacer(1, 20))
-    
-    # Build the PDF
-    try:
-        doc.build(story)
-        print(f"PDF report generated successfully at: {output_path}")
-        return True
-    except Exception as e:
-        print(f"Error generating PDF: {e}")
-        return False
+def generate_pdf_report(report_data, output_path, on_section=None, template=None):
+    """
+    Generate a PDF report from the synthesized data
+
+    Args:
+        report_data: The synthesized report as a string, a dict of sections, or an
+            iterable of section strings (e.g. streamed from the model)
+        output_path (str): Where to write the PDF
+        on_section (callable, optional): Called with (count, section_text) after
+            each streamed section has been added to the report
+        template (ReportTemplate, optional): Template to render with instead of
+            the shared one
+    """
+    template = template or get_report_template()
+    return template.render(report_data, output_path, on_section=on_section)
 
-def run_report_generation():
-    """Main function to run the entire report generation process"""
+def _timed_sections(sections, timings, stage_start):
+    """Pass sections through, recording time to the first one and to the end of the stream."""
+    for section in sections:
+        if 'first_section' not in timings:
+            timings['first_section'] = time.perf_counter() - stage_start
+        yield section
+    timings['synthesize'] = time.perf_counter() - stage_start
+
+def run_report_generation(timings=None, output_path=None, surgery_id=None, stream=True, on_progress=None,
+                          cache=None, report_info=None):
+    """
+    Main function to run the entire report generation process
+
+    Args:
+        surgery_id (optional): Only report on this surgery's data
+        output_path (str, optional): Where to write the PDF. Defaults to a
+            timestamped file under generated_reports/
+        timings (dict, optional): Filled with the seconds spent in each stage
+            ('collect', 'synthesize', 'render', plus 'first_section' when
+            streaming) as they complete
+        stream (bool, optional): Stream the synthesis and build the PDF story
+            section by section instead of waiting for the whole report
+        on_progress (callable, optional): Called with (count, section_text) as
+            each streamed section is added to the report
+        cache (ReportCache, optional): Reuse the PDF of an earlier run whose
+            collected data had the same digest, and store new reports in it.
+            When given, the returned path is the cached file.
+        report_info (dict, optional): Filled with the inputs 'digest' and
+            whether the report was served from 'cached'
+    """
     print("Starting post-surgery report generation process...")
+    if timings is None:
+        timings = {}
+    if report_info is None:
+        report_info = {}
     
     try:
         # Create output directory if it doesn't exist
-        output_dir = "generated_reports"
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+        output_dir = os.path.dirname(output_path) if output_path else "generated_reports"
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
             print(f"Created output directory: {output_dir}")
         
-        # Generate timestamp for unique filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_path = os.path.join(output_dir, f"post_surgery_report_{timestamp}.pdf")
+        if output_path is None:
+            # Generate timestamp for unique filename
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            output_path = os.path.join(output_dir, f"post_surgery_report_{timestamp}.pdf")
         print(f"Will save report to: {output_path}")
         
-        # Synthesize report
-        print("Synthesizing post-surgery report...")
-        try:
-            synthesized_report = synthesize_post_surgery_report()
-            print(f"Synthesis result: {bool(synthesized_report)}")
-        except Exception as synth_error:
-            print(f"Error in report synthesis: {str(synth_error)}")
+        # Collect data
+        stage_start = time.perf_counter()
+        collected_data = collect_post_surgery_report_data(surgery_id)
+        timings['collect'] = time.perf_counter() - stage_start
+        
+        if collected_data is None:
+            print("Failed to generate report - no data collected")
             return None
         
-        if synthesized_report:
+        if cache is not None:
+            digest = report_inputs_digest(collected_data)
+            report_info['digest'] = digest
+            cached_path = cache.get(digest)
+            report_info['cached'] = cached_path is not None
+            if cached_path:
+                print(f"Inputs unchanged since an earlier run; reusing {cached_path}")
+                return cached_path
+        
+        if stream:
+            print("Streaming post-surgery report into PDF...")
+            stage_start = time.perf_counter()
+            sections = _timed_sections(stream_post_surgery_report(collected_data), timings, stage_start)
+            try:
+                success = generate_pdf_report(sections, output_path, on_section=on_progress)
+                print(f"PDF generation result: {success}")
+            except Exception as stream_error:
+                print(f"Error in streamed report generation: {str(stream_error)}")
+                return None
+            finally:
+                timings['render'] = time.perf_counter() - stage_start - timings.get('synthesize', 0)
+        else:
+            # Synthesize report
+            print("Synthesizing post-surgery report...")
+            stage_start = time.perf_counter()
+            try:
+                synthesized_report = synthesize_post_surgery_report(collected_data)
+                print(f"Synthesis result: {bool(synthesized_report)}")
+            except Exception as synth_error:
+                print(f"Error in report synthesis: {str(synth_error)}")
+                return None
+            finally:
+                timings['synthesize'] = time.perf_counter() - stage_start
+            
+            if not synthesized_report:
+                print("Failed to synthesize report - got empty result")
+                return None
+
             print("Report synthesis complete. Generating PDF...")
+            stage_start = time.perf_counter()
             try:
                 success = generate_pdf_report(synthesized_report, output_path)
                 print(f"PDF generation result: {success}")
             except Exception as pdf_error:
                 print(f"Error in PDF generation: {str(pdf_error)}")
                 return None
+            finally:
+                timings['render'] = time.perf_counter() - stage_start
                 
-            if success:
-                if os.path.exists(output_path):
-                    print(f"Successfully generated report at {output_path}")
-                    return output_path
-                else:
-                    print(f"PDF file not found at expected path: {output_path}")
-                    return None
+        if success:
+            if os.path.exists(output_path):
+                if report_info.get('digest'):
+                    output_path = cache.put(report_info['digest'], output_path)
+                print(f"Successfully generated report at {output_path}")
+                return output_path
             else:
-                print("Failed to generate PDF report.")
+                print(f"PDF file not found at expected path: {output_path}")
                 return None
         else:
-            print("Failed to synthesize report - got empty result")
+            print("Failed to generate PDF report.")
             return None
             
     except Exception as e:
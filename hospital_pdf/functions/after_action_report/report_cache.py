@@ -0,0 +1,108 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from typing import Dict, Optional
+
+REPORT_CACHE_DIR = os.path.join("generated_reports", "cache")
+REPORT_CACHE_MAX_BYTES = int(os.getenv('REPORT_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+# Bump when the prompt or layout changes so older PDFs are no longer served
+REPORT_FORMAT_VERSION = "1"
+
+
+def report_inputs_digest(collected_data: Dict) -> str:
+    """SHA-256 of the collected report inputs in canonical JSON form."""
+    payload = json.dumps(
+        {'version': REPORT_FORMAT_VERSION, 'data': collected_data},
+        sort_keys=True, separators=(',', ':'), default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ReportCache:
+    """
+    Finished report PDFs keyed by the digest of the data they were built from.
+
+    Files live in one directory with their modification time used as the last-use
+    time, so recency survives restarts. Once the directory grows past max_bytes the
+    least recently used reports are deleted.
+    """
+
+    def __init__(self, directory: str = REPORT_CACHE_DIR, max_bytes: int = REPORT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.directory, f"post_surgery_report_{digest}.pdf")
+
+    def get(self, digest: str) -> Optional[str]:
+        """Return the cached PDF for a digest, marking it recently used."""
+        path = self.path_for(digest)
+        with self._lock:
+            try:
+                os.utime(path)
+            except OSError:
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits'] += 1
+            return path
+
+    def put(self, digest: str, pdf_path: str) -> str:
+        """
+        Move a freshly generated PDF into the cache and enforce the size cap.
+
+        Returns:
+            str: The cached path, which replaces pdf_path
+        """
+        path = self.path_for(digest)
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            try:
+                os.replace(pdf_path, path)
+            except OSError:
+                # Different filesystem: copy then drop the original
+                shutil.copyfile(pdf_path, path)
+                os.remove(pdf_path)
+            self._evict(keep=path)
+        return path
+
+    def _evict(self, keep: str):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith('.pdf'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+                self.stats['evictions'] += 1
+            except OSError:
+                pass
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_report_cache() -> ReportCache:
+    """Return the process-wide report cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ReportCache()
+        return _cache
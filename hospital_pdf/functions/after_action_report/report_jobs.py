@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from .generate_report import run_report_generation
+from .report_cache import get_report_cache
+
+REPORT_WORKERS = int(os.getenv('REPORT_WORKERS', '2'))
+# Jobs queued or running at once; further submissions are rejected
+MAX_PENDING_JOBS = int(os.getenv('REPORT_MAX_PENDING', '8'))
+# Finished jobs are forgotten after this long
+JOB_RETENTION_SECONDS = 60 * 60
+
+REPORTS_DIR = "generated_reports"
+
+
+class QueueFullError(Exception):
+    """Raised when the report queue has no room for another job."""
+
+
+class ReportJob:
+    """Status record of one report generation."""
+
+    def __init__(self, key: str, params: Dict):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.params = params
+        self.status = 'queued'
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.timings = {}
+        self.output_path = None
+        self.error = None
+        # Digest of the collected inputs; doubles as the PDF's ETag
+        self.digest = None
+        self.cached = False
+        self.sections_completed = 0
+        self.latest_section = None
+        # Bumped on every status or progress change, for change-feed consumers
+        self.version = 0
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ('done', 'failed')
+
+    def to_dict(self) -> Dict:
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'params': self.params,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'timings': dict(self.timings),
+            'digest': self.digest,
+            'cached': self.cached,
+            'sections_completed': self.sections_completed,
+            'latest_section': self.latest_section,
+            'error': self.error
+        }
+
+
+class ReportJobQueue:
+    """
+    Runs report generation on a worker pool instead of the request thread.
+
+    Identical requests submitted while a matching job is queued or running share
+    that job, and the queue rejects work beyond max_pending so clients back off.
+    """
+
+    def __init__(self, workers: int = REPORT_WORKERS, max_pending: int = MAX_PENDING_JOBS):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report-job')
+        self._jobs: Dict[str, ReportJob] = {}
+        self._active: Dict[str, ReportJob] = {}
+        self._changed = threading.Condition()
+
+    def _purge(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for job_id in [jid for jid, job in self._jobs.items() if job.finished and job.finished < cutoff]:
+            del self._jobs[job_id]
+
+    def submit(self, params: Optional[Dict] = None) -> Tuple[ReportJob, bool]:
+        """
+        Queue a report, or join an identical one that is already pending.
+
+        Returns:
+            Tuple[ReportJob, bool]: The job and whether it was newly created
+
+        Raises:
+            QueueFullError: If max_pending jobs are already queued or running
+        """
+        params = params or {}
+        key = json.dumps(params, sort_keys=True)
+
+        with self._changed:
+            self._purge()
+            existing = self._active.get(key)
+            if existing is not None:
+                print(f"Joining pending report job {existing.id}")
+                return existing, False
+
+            if len(self._active) >= self.max_pending:
+                raise QueueFullError(f"{len(self._active)} report jobs already pending")
+
+            job = ReportJob(key, params)
+            self._jobs[job.id] = job
+            self._active[key] = job
+
+        print(f"Queued report job {job.id}")
+        self._executor.submit(self._run, job)
+        return job, True
+
+    def _run(self, job: ReportJob):
+        with self._changed:
+            job.status = 'running'
+            job.started = time.time()
+            job.timings['queued'] = job.started - job.created
+            job.version += 1
+            self._changed.notify_all()
+
+        def on_progress(count, section):
+            with self._changed:
+                job.sections_completed = count
+                # A short preview is enough for progress displays
+                job.latest_section = section[:200]
+                job.version += 1
+                self._changed.notify_all()
+
+        output_path = os.path.join(REPORTS_DIR, f"post_surgery_report_{job.id}.pdf")
+        report_info = {}
+        try:
+            output_path = run_report_generation(
+                timings=job.timings,
+                output_path=output_path,
+                surgery_id=job.params.get('surgery_id'),
+                on_progress=on_progress,
+                cache=get_report_cache(),
+                report_info=report_info
+            )
+            error = None if output_path else 'Failed to generate report'
+        except Exception as e:
+            output_path, error = None, str(e)
+
+        with self._changed:
+            job.finished = time.time()
+            job.timings['total'] = job.finished - job.created
+            job.output_path = output_path
+            job.digest = report_info.get('digest')
+            job.cached = report_info.get('cached', False)
+            job.error = error
+            job.status = 'failed' if error else 'done'
+            job.version += 1
+            self._active.pop(job.key, None)
+            self._changed.notify_all()
+        print(f"Report job {job.id} {job.status} in {job.timings['total']:.1f}s")
+
+    def get(self, job_id: str) -> Optional[ReportJob]:
+        with self._changed:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id: str, timeout: float) -> Optional[ReportJob]:
+        """Long-poll: block until the job finishes or the timeout elapses."""
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._changed.wait_for(lambda: job.is_finished, timeout=timeout)
+            return job
+
+    def wait_for_change(self, job_id: str, version: int, timeout: float) -> Optional[ReportJob]:
+        """Block until the job's version moves past the given one or the timeout elapses."""
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._changed.wait_for(lambda: job.version != version, timeout=timeout)
+            return job
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_report_queue() -> ReportJobQueue:
+    """Return the process-wide report queue, starting its workers on first use."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = ReportJobQueue()
+        return _queue
@@ -0,0 +1,195 @@
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.lib.units import inch
+from datetime import datetime
+import os
+import time
+import threading
+
+PAGE_MARGIN = 72
+
+
+class ReportTemplate:
+    """
+    Styles, table style and page layout of the post-surgery report.
+
+    getSampleStyleSheet() builds a whole stylesheet, so creating styles per
+    paragraph adds up on long reports. A template builds everything once and is
+    shared by every report in the process. Styles are never mutated after
+    construction, so concurrent builds can share them safely.
+    """
+
+    def __init__(self, pagesize=letter, margin=PAGE_MARGIN):
+        self.page_settings = {
+            'pagesize': pagesize,
+            'rightMargin': margin,
+            'leftMargin': margin,
+            'topMargin': margin,
+            'bottomMargin': margin
+        }
+
+        styles = getSampleStyleSheet()
+        self.normal_style = styles['Normal']
+        self.title_style = ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            spaceAfter=30,
+            textColor=colors.HexColor('#1B365D')
+        )
+        self.header_style = ParagraphStyle(
+            'CustomHeader',
+            parent=styles['Heading1'],
+            fontSize=14,
+            spaceAfter=20,
+            textColor=colors.HexColor('#2E5A88')
+        )
+        self.content_style = ParagraphStyle(
+            'CustomContent',
+            parent=styles['Normal'],
+            fontSize=10,
+            leading=14,
+            spaceAfter=10
+        )
+
+        self.table_col_widths = [2*inch, 4*inch]
+        self.table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#F5F5F5')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#2E5A88')),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#CCCCCC'))
+        ])
+
+    def new_document(self, output_path):
+        """Create a document for one report; documents hold per-build state and are never shared."""
+        return SimpleDocTemplate(output_path, **self.page_settings)
+
+    def section_header(self, text):
+        """Create a styled section header"""
+        return Paragraph(text, self.header_style)
+
+    def content_paragraph(self, text):
+        """Create a styled content paragraph"""
+        return Paragraph(text, self.content_style)
+
+    def data_table(self, data):
+        """Format data into a table structure"""
+        if not data:
+            return None
+
+        # Convert data to list of lists for table
+        table_data = [[k, str(v)] for k, v in data.items()]
+
+        table = Table(table_data, colWidths=self.table_col_widths)
+        table.setStyle(self.table_style)
+        return table
+
+    def render(self, report_data, output_path, on_section=None):
+        """
+        Generate a PDF report from the synthesized data
+
+        Args:
+            report_data: The synthesized report as a string, a dict of sections, or an
+                iterable of section strings (e.g. streamed from the model). Iterables are
+                turned into flowables as each section arrives.
+            output_path (str): Where to write the PDF, or a writable file object
+            on_section (callable, optional): Called with (count, section_text) after
+                each section of an iterable has been added to the story
+
+        Returns:
+            bool: True if the PDF was built
+        """
+        print("Starting PDF generation...")
+        doc = self.new_document(output_path)
+
+        # Initialize story (content elements)
+        story = [
+            Paragraph("Post-Surgery Report", self.title_style),
+            Paragraph(
+                f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+                self.normal_style
+            ),
+            Spacer(1, 20)
+        ]
+
+        # Add synthesized report content
+        if isinstance(report_data, str):
+            # If report_data is a string, split it into sections
+            for section in report_data.split('\n\n'):
+                if section.strip():
+                    story.append(self.content_paragraph(section))
+                    story.append(Spacer(1, 10))
+        elif isinstance(report_data, dict):
+            # If report_data is a dictionary, process each section
+            for section_title, content in report_data.items():
+                story.append(self.section_header(section_title.replace('_', ' ').title()))
+                if isinstance(content, (dict, list)):
+                    table = self.data_table(content if isinstance(content, dict) else {str(i): item for i, item in enumerate(content)})
+                    if table:
+                        story.append(table)
+                else:
+                    story.append(self.content_paragraph(str(content)))
+                story.append(Spacer(1, 20))
+        else:
+            # Streamed sections: build each one's flowables as soon as it arrives
+            count = 0
+            for section in report_data:
+                story.append(self.content_paragraph(section))
+                story.append(Spacer(1, 10))
+                count += 1
+                if on_section:
+                    on_section(count, section)
+            if count == 0:
+                print("No report sections received. Skipping PDF build.")
+                return False
+
+        # Build the PDF
+        try:
+            doc.build(story)
+            print(f"PDF report generated successfully at: {output_path}")
+            return True
+        except Exception as e:
+            print(f"Error generating PDF: {e}")
+            return False
+
+
+_template = None
+_template_lock = threading.Lock()
+
+
+def get_report_template():
+    """Return the process-wide report template, building it on first use."""
+    global _template
+    with _template_lock:
+        if _template is None:
+            _template = ReportTemplate()
+        return _template
+
+
+def render_report_file(report_data, output_path):
+    """
+    Render a report to output_path in a worker process.
+
+    The PDF is written to a temporary file and moved into place, so a reader
+    never sees a half-written report.
+
+    Returns:
+        Dict: 'success' and the 'seconds' spent rendering
+    """
+    start = time.perf_counter()
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    success = get_report_template().render(report_data, tmp_path)
+    if success:
+        os.replace(tmp_path, output_path)
+    elif os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    return {'success': success, 'seconds': time.perf_counter() - start}
@@ -5,7 +5,9 @@ import json
 from dotenv import load_dotenv
 from datetime import datetime
 import time
-import PyPDF2
+from .pdf_text import extract_pdf_text
+from .pdf_retrieval import retrieve_pdf_context, DEFAULT_TOP_K
+from .llm_cache import cached_completion
 
 # Load environment variables from .env file
 load_dotenv()
@@ -24,8 +26,14 @@ Your primary responsibilities are:
 
 Remember: When in doubt or if information is not explicitly stated in the PDF, always respond with 'n'."""
 
-def call_openai_live(prompt_question, prompt_content, pdf_path=None):
-    """Live/immediate OpenAI API call for single requests with optional PDF context"""
+def call_openai_live(prompt_question, prompt_content, pdf_path=None, bypass_cache=False,
+                     full_document=False, top_k=DEFAULT_TOP_K, model="gpt-4o", temperature=0.1):
+    """
+    Live/immediate OpenAI API call for single requests with optional PDF context.
+    
+    By default only the top_k PDF chunks most relevant to the question are sent,
+    each with its page citation. Set full_document=True to send the whole PDF text.
+    """
     try:
         # Prepare the content message
         content_message = prompt_question + prompt_content
@@ -34,27 +42,25 @@ def call_openai_live(prompt_question, prompt_content, pdf_path=None):
         if pdf_path and os.path.exists(pdf_path):
             print("Processing PDF file...")
             try:
-                # Read PDF content
-                with open(pdf_path, 'rb') as file:
-                    print("Reading PDF...")
-                    pdf_reader = PyPDF2.PdfReader(file)
-                    pdf_text = ""
-                    total_pages = len(pdf_reader.pages)
-                    
-                    for i, page in enumerate(pdf_reader.pages):
-                        print(f"Processing page {i+1}/{total_pages}")
-                        pdf_text += page.extract_text() + "\n"
+                excerpts = None if full_document else retrieve_pdf_context(pdf_path, content_message, top_k)
                 
-                content_message = f"PDF Content:\n{pdf_text}\n\nQuestion:\n{content_message}"
+                if excerpts:
+                    content_message = f"PDF Excerpts (cited by page):\n{excerpts}\n\nQuestion:\n{content_message}"
+                else:
+                    # Page text is cached on disk, keyed by path, mtime and size
+                    pdf_text = extract_pdf_text(pdf_path)
+                    content_message = f"PDF Content:\n{pdf_text}\n\nQuestion:\n{content_message}"
                 print("PDF processing complete")
             
             except Exception as pdf_error:
                 print(f"Error processing PDF: {pdf_error}")
                 return "Error processing PDF"
 
-        completion = client.chat.completions.create(
-            model="gpt-4o",
-            temperature=0.1,
+        return cached_completion(
+            client,
+            bypass_cache=bypass_cache,
+            model=model,
+            temperature=temperature,
             messages=[
                 {
                     "role": "system",
@@ -66,8 +72,6 @@ def call_openai_live(prompt_question, prompt_content, pdf_path=None):
                 }
             ]
         )
-        
-        return completion.choices[0].message.content
 
     except Exception as error:
         print("Error during OpenAI call:", error)
@@ -0,0 +1,143 @@
+import os
+import csv
+import json
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .combinePDF import merge_pdfs
+
+# Sidecar written next to each output, recording the checksums it was built from
+STATE_SUFFIX = '.merge.json'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def read_manifest(manifest_path: str) -> List[Dict]:
+    """
+    Read merge jobs from a JSONL or CSV manifest.
+
+    JSONL lines look like {"inputs": ["a.pdf", "b.pdf"], "output": "packet.pdf"}.
+    CSV rows are output,input1,input2,... with an optional header row starting
+    with "output". Relative paths are resolved against the manifest's directory.
+
+    Returns:
+        List[Dict]: Jobs with 'inputs' and 'output' keys
+    """
+    base_dir = Path(manifest_path).parent
+    jobs = []
+
+    with open(manifest_path, 'r', newline='', encoding='utf-8') as f:
+        if manifest_path.lower().endswith('.csv'):
+            for row in csv.reader(f):
+                cells = [cell.strip() for cell in row if cell.strip()]
+                if not cells or cells[0].lower() == 'output':
+                    continue
+                jobs.append({'output': cells[0], 'inputs': cells[1:]})
+        else:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    jobs.append({'output': entry['output'], 'inputs': list(entry['inputs'])})
+
+    for job in jobs:
+        job['output'] = str(base_dir / job['output'])
+        job['inputs'] = [str(base_dir / path) for path in job['inputs']]
+    return jobs
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def inputs_digest(inputs: List[str]) -> str:
+    """Combined checksum of the input files, in merge order."""
+    digest = hashlib.sha256()
+    for path in inputs:
+        digest.update(file_digest(path).encode('ascii'))
+    return digest.hexdigest()
+
+def _read_state(output: str) -> Optional[Dict]:
+    try:
+        with open(output + STATE_SUFFIX, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def run_merge_job(job: Dict, force: bool = False) -> Dict:
+    """
+    Merge one job's inputs unless the output is already up to date.
+
+    Returns:
+        Dict: The job's output, status ('merged', 'skipped' or 'failed'),
+            seconds taken and bytes read/written
+    """
+    start = time.perf_counter()
+    output = job['output']
+    result = {'output': output, 'status': 'failed', 'bytes_in': 0, 'bytes_out': 0}
+
+    try:
+        result['bytes_in'] = sum(os.path.getsize(path) for path in job['inputs'])
+        digest = inputs_digest(job['inputs'])
+        state = _read_state(output)
+
+        if (not force and state and state.get('inputs') == digest
+                and os.path.exists(output) and file_digest(output) == state.get('output')):
+            result['status'] = 'skipped'
+        else:
+            Path(output).parent.mkdir(parents=True, exist_ok=True)
+            tmp_output = f"{output}.{os.getpid()}.tmp"
+            if merge_pdfs(job['inputs'], tmp_output):
+                os.replace(tmp_output, output)
+                with open(output + STATE_SUFFIX, 'w', encoding='utf-8') as f:
+                    json.dump({'inputs': digest, 'output': file_digest(output)}, f)
+                result['status'] = 'merged'
+                result['bytes_out'] = os.path.getsize(output)
+            elif os.path.exists(tmp_output):
+                os.remove(tmp_output)
+
+    except Exception as e:
+        result['error'] = str(e)
+        print(f"Error merging {output}: {str(e)}")
+
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def run_batch(jobs: List[Dict], workers: Optional[int] = None, force: bool = False) -> Dict:
+    """
+    Run merge jobs across a process pool.
+
+    Args:
+        jobs (List[Dict]): Jobs with 'inputs' and 'output' keys
+        workers (int, optional): Number of processes (defaults to the CPU count)
+        force (bool): Re-merge even when the output is up to date
+
+    Returns:
+        Dict: Per-job results plus totals, wall time and throughput
+    """
+    start = time.perf_counter()
+    results = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_merge_job, job, force) for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"[{result['status']}] {result['output']} ({result['seconds']:.2f}s)")
+
+    elapsed = time.perf_counter() - start
+    merged = [r for r in results if r['status'] == 'merged']
+    bytes_in = sum(r['bytes_in'] for r in merged)
+
+    return {
+        'jobs': results,
+        'merged': len(merged),
+        'skipped': sum(1 for r in results if r['status'] == 'skipped'),
+        'failed': sum(1 for r in results if r['status'] == 'failed'),
+        'seconds': elapsed,
+        'jobs_per_second': len(results) / elapsed if elapsed else 0.0,
+        'mb_per_second': bytes_in / (1024 * 1024) / elapsed if elapsed else 0.0
+    }
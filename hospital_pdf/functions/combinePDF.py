@@ -1,53 +1,173 @@
 from PyPDF2 import PdfMerger
+from contextlib import ExitStack
+from typing import BinaryIO, Iterable, Iterator, Union
 import io
+import os
+import mmap
+import queue
+import threading
+
+PdfSource = Union[str, os.PathLike, bytes, bytearray, memoryview, mmap.mmap, BinaryIO]
+
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_QUEUE_CHUNKS = 16
+
+def _open_source(source: PdfSource, stack: ExitStack):
+    """Turn a PDF source into a seekable stream without copying it into memory."""
+    if isinstance(source, (str, os.PathLike)):
+        pdf_file = stack.enter_context(open(source, 'rb'))
+        try:
+            # Memory-map files so pages are paged in on demand by the OS
+            return stack.enter_context(mmap.mmap(pdf_file.fileno(), 0, access=mmap.ACCESS_READ))
+        except (ValueError, OSError):
+            return pdf_file
+    if isinstance(source, memoryview) and isinstance(source.obj, bytes) \
+            and source.contiguous and source.nbytes == len(source.obj):
+        # A view of a whole bytes object: share the object itself
+        source = source.obj
+    if isinstance(source, bytes):
+        # BytesIO shares an immutable bytes buffer instead of copying it
+        return io.BytesIO(source)
+    if isinstance(source, (bytearray, memoryview)):
+        # Mutable or partial buffers are copied exactly once, by BytesIO itself
+        return io.BytesIO(source)
+    # mmap objects and file objects already support read/seek/tell
+    return source
+
+def merge_pdfs(sources: Iterable[PdfSource], output: Union[str, os.PathLike, BinaryIO]) -> bool:
+    """
+    Merges any number of PDFs, writing the result straight to a file or stream.
+
+    Args:
+        sources (Iterable): PDFs to merge in order, as paths, file objects,
+            memory-mapped buffers or bytes
+        output: Path of the merged PDF, or a writable file object
+
+    Returns:
+        bool: True if the merged PDF was written, False if an error occurred
+    """
+    try:
+        merger = PdfMerger()
+
+        with ExitStack() as stack:
+            count = 0
+            for source in sources:
+                merger.append(_open_source(source, stack))
+                count += 1
+            print(f"Merging {count} PDFs...")
+
+            # Inputs are read lazily, so they must stay open until the write finishes
+            if isinstance(output, (str, os.PathLike)):
+                with open(output, 'wb') as output_file:
+                    merger.write(output_file)
+            else:
+                merger.write(output)
+            merger.close()
+
+        print("Successfully merged PDFs")
+        return True
+
+    except Exception as e:
+        print(f"An error occurred while merging PDFs: {str(e)}")
+        return False
+
+def _put_chunk(chunks: queue.Queue, cancelled: threading.Event, item):
+    """Queue an item for the consumer, giving up once it has gone away."""
+    while True:
+        if cancelled.is_set():
+            raise IOError("PDF stream consumer went away")
+        try:
+            chunks.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+
+class _QueueWriter(io.RawIOBase):
+    """Write-only stream that hands fixed-size chunks to a consumer thread."""
+
+    def __init__(self, chunks: queue.Queue, cancelled: threading.Event, chunk_size: int):
+        self._chunks = chunks
+        self._cancelled = cancelled
+        self._chunk_size = chunk_size
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        # PdfWriter records object offsets for the xref table via tell()
+        return self._position
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        while len(self._buffer) >= self._chunk_size:
+            _put_chunk(self._chunks, self._cancelled, bytes(self._buffer[:self._chunk_size]))
+            del self._buffer[:self._chunk_size]
+        return len(data)
+
+    def flush_remaining(self):
+        if self._buffer:
+            _put_chunk(self._chunks, self._cancelled, bytes(self._buffer))
+            self._buffer.clear()
+
+def iter_merged_pdf(sources: Iterable[PdfSource], chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Merges PDFs and yields the result in chunks, e.g. for a streamed HTTP response.
+
+    The merge runs on a background thread behind a bounded queue, so only a few
+    chunks of output are held in memory at once.
+
+    Raises:
+        IOError: If the merge fails
+    """
+    chunks = queue.Queue(maxsize=STREAM_QUEUE_CHUNKS)
+    cancelled = threading.Event()
+    done = object()
+    result = {}
+
+    def produce():
+        writer = _QueueWriter(chunks, cancelled, chunk_size)
+        try:
+            result['success'] = merge_pdfs(sources, writer)
+            writer.flush_remaining()
+        except IOError:
+            result['success'] = False
+        finally:
+            try:
+                _put_chunk(chunks, cancelled, done)
+            except IOError:
+                pass
+
+    producer = threading.Thread(target=produce, name='pdf-merge-stream', daemon=True)
+    producer.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is done:
+                break
+            yield chunk
+        if not result.get('success'):
+            raise IOError("Failed to merge PDFs")
+    finally:
+        cancelled.set()
 
 def combine_pdfs(pdf1_data: bytes, pdf2_data: bytes) -> bytes:
     """
     Combines two PDF files (in bytes format) into a single PDF file.
-    
+
+    Kept for callers that already hold both PDFs in memory; prefer merge_pdfs
+    or iter_merged_pdf for files and large documents.
+
     Args:
         pdf1_data (bytes): First PDF file as bytes
         pdf2_data (bytes): Second PDF file as bytes
-        
+
     Returns:
         bytes: Combined PDF as bytes, or None if an error occurred
     """
-    try:
-        print("Starting PDF combination process...")
-        
-        # Create PDF merger object
-        merger = PdfMerger()
-        
-        # Convert bytes to file-like objects
-        pdf1_file = io.BytesIO(pdf1_data)
-        pdf2_file = io.BytesIO(pdf2_data)
-        
-        # Add the PDFs to merger
-        print("Adding first PDF...")
-        merger.append(pdf1_file)
-        print("Adding second PDF...")
-        merger.append(pdf2_file)
-        
-        # Create output buffer
-        output_buffer = io.BytesIO()
-        
-        # Write to output buffer
-        print("Writing combined PDF...")
-        merger.write(output_buffer)
-        
-        # Close the merger and input files
-        merger.close()
-        pdf1_file.close()
-        pdf2_file.close()
-        
-        # Get the bytes from the buffer
-        output_buffer.seek(0)
-        combined_pdf = output_buffer.getvalue()
-        output_buffer.close()
-        
-        print("Successfully created combined PDF in memory")
-        return combined_pdf
-        
-    except Exception as e:
-        print(f"An error occurred while combining PDFs: {str(e)}")
-        return None
\ No newline at end of file
+    output_buffer = io.BytesIO()
+    if not merge_pdfs([pdf1_data, pdf2_data], output_buffer):
+        return None
+    return output_buffer.getvalue()
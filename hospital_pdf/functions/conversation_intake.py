@@ -2,11 +2,13 @@ from openai import OpenAI
 import os
 from dotenv import load_dotenv
 import logging
-from typing import List, Dict
-from .supabase_functions.supabaseFunctions import initialize_supabase
+import threading
+from typing import List, Dict, Optional, Tuple
+from .supabase_functions.requirement_catalog import get_requirement_catalog
 import json
-from .perplexity import search_and_answer
-from .supabase_functions.checklist_update import update_requirement_status
+from .perplexity import search_and_answer_many
+from .llm_cache import cached_completion
+from .supabase_functions.checklist_update import update_requirement_statuses
 
 # Load environment variables
 load_dotenv()
@@ -44,7 +46,8 @@ Rules:
 4. Partial satisfaction of a requirement should be marked as 'B'
 5. Any ambiguity should be marked as 'B'"""
 
-def process_compliance_requirements(requirements: List[str], conversation_context: str, instructions: List[str] = None) -> List[Dict[str, str]]:
+def process_compliance_requirements(requirements: List[str], conversation_context: str, instructions: List[str] = None,
+                                    bypass_cache: bool = False) -> List[Dict[str, str]]:
     """
     Process multiple compliance requirements against conversation context.
     
@@ -52,6 +55,7 @@ def process_compliance_requirements(requirements: List[str], conversation_contex
         requirements (List[str]): List of compliance requirements to check
         conversation_context (str): The conversation context to analyze
         instructions (List[str], optional): List of instructions corresponding to each requirement
+        bypass_cache (bool, optional): Always call the model instead of reusing a cached answer
         
     Returns:
         List[Dict[str, str]]: List of results containing requirement and status (A/B/C)
@@ -82,7 +86,9 @@ Compliance Requirements:
 Remember: Respond ONLY with A, B, or C for each requirement, one per line."""
         
         print("Making OpenAI API call...")
-        completion = client.chat.completions.create(
+        response_text = cached_completion(
+            client,
+            bypass_cache=bypass_cache,
             model="gpt-4o",
             temperature=0.1,
             messages=[
@@ -98,7 +104,7 @@ Remember: Respond ONLY with A, B, or C for each requirement, one per line."""
         )
         
         # Process response
-        response_lines = completion.choices[0].message.content.strip().split('\n')
+        response_lines = response_text.strip().split('\n')
         print(f"Received {len(response_lines)} responses")
         
         # Validate and pair responses with requirements
@@ -122,30 +128,143 @@ Remember: Respond ONLY with A, B, or C for each requirement, one per line."""
         print(error_msg)
         return None
 
-def test_compliance_processing(conversation_text: str):
+class ComplianceTracker:
+    """
+    Per-surgery compliance state for incremental checking.
+    
+    Only requirements that are still open in the current phase and the one after it
+    are sent to the model, so the prompt shrinks as the surgery progresses.
+    """
+    
+    def __init__(self, surgery_id: str, lookahead_phases: int = 1):
+        self.surgery_id = surgery_id
+        self.lookahead_phases = lookahead_phases
+        self.completed = set()
+        self.current_phase = None
+        self.stats = {'calls': 0, 'evaluated': 0, 'skipped': 0}
+        self._lock = threading.Lock()
+        
+    def open_requirements(self) -> Tuple[List[str], List[str]]:
+        """
+        Select the requirements worth evaluating on the next conversation chunk.
+        
+        Returns:
+            Tuple[List[str], List[str]]: Open requirement texts and their instructions
+        """
+        catalog = get_requirement_catalog()
+        rows = catalog.requirements()
+        
+        with self._lock:
+            open_rows = [
+                row for row in rows
+                if not row['completion_status'] and row['requirement'] not in self.completed
+            ]
+            open_phases = [phase for phase in catalog.phases() if any(row['phase'] == phase for row in open_rows)]
+            active_phases = set(open_phases[:1 + self.lookahead_phases])
+            self.current_phase = open_phases[0] if open_phases else None
+            
+            selected = [row for row in open_rows if row['phase'] in active_phases]
+            self.stats['calls'] += 1
+            self.stats['evaluated'] += len(selected)
+            self.stats['skipped'] += len(rows) - len(selected)
+            
+        print(f"[{self.surgery_id}] Evaluating {len(selected)}/{len(rows)} requirements (phase: {self.current_phase})")
+        return [row['requirement'] for row in selected], [row.get('instructions') for row in selected]
+    
+    def record_completed(self, requirements: List[str]):
+        """Remember requirements satisfied during this surgery."""
+        with self._lock:
+            self.completed.update(requirements)
+            
+    def get_stats(self) -> Dict:
+        """Return skipped vs evaluated counters for this surgery."""
+        with self._lock:
+            return dict(self.stats, surgery_id=self.surgery_id, current_phase=self.current_phase,
+                        completed=len(self.completed))
+
+_trackers: Dict[str, ComplianceTracker] = {}
+# Holders of each surgery's tracker: open sessions and in-flight compliance checks
+_tracker_refs: Dict[str, int] = {}
+_trackers_lock = threading.Lock()
+
+def find_compliance_tracker(surgery_id: str) -> Optional[ComplianceTracker]:
+    """Return a surgery's tracker if one is held, without creating it."""
+    with _trackers_lock:
+        return _trackers.get(surgery_id)
+
+def acquire_compliance_tracker(surgery_id: str) -> ComplianceTracker:
+    """Return a surgery's tracker, creating it on first use, and hold a reference to it."""
+    with _trackers_lock:
+        if surgery_id not in _trackers:
+            _trackers[surgery_id] = ComplianceTracker(surgery_id)
+        _tracker_refs[surgery_id] = _tracker_refs.get(surgery_id, 0) + 1
+        return _trackers[surgery_id]
+
+def release_compliance_tracker(surgery_id: str):
+    """Drop a reference taken by acquire_compliance_tracker; the last one removes the tracker."""
+    with _trackers_lock:
+        refs = _tracker_refs.get(surgery_id, 0) - 1
+        if refs > 0:
+            _tracker_refs[surgery_id] = refs
+        else:
+            _tracker_refs.pop(surgery_id, None)
+            _trackers.pop(surgery_id, None)
+
+def _complete_requirements(requirements: List[str], tracker: Optional[ComplianceTracker] = None):
+    """Mark the satisfied requirements as completed with one bulk update."""
+    if not requirements:
+        return
+    updated = update_requirement_statuses(requirements)
+    if updated is None:
+        # Leave them open so the next chunk re-evaluates them
+        print("⚠ Failed to update requirement statuses in database")
+        return
+    print(f"✓ {len(updated)} requirement statuses updated in database")
+    if tracker is not None:
+        tracker.record_completed(updated)
+
+def test_compliance_processing(conversation_text: str, surgery_id: Optional[str] = None):
     """
     Test function for the batch compliance checking system using real requirements from Supabase
+    
+    Satisfied ('A') requirements are completed in one bulk update and every 'B'
+    requirement gets a Perplexity clarification, all merged into one response.
+    
+    Args:
+        conversation_text (str): The conversation chunk to evaluate
+        surgery_id (str, optional): Enables incremental mode, which only evaluates
+            requirements still open for this surgery in its current and next phase.
+            The surgery's tracker outlives this call only while a session holds it.
+            
+    Returns:
+        Dict: 'satisfied' requirement texts and 'clarifications' as requirement/answer pairs,
+            or None if processing failed
     """
+    tracker = None
     try:
-        # Get all requirements from Supabase
-        supabase = initialize_supabase()
-        result = supabase.table('treehacks_reqs') \
-            .select('requirement,instructions') \
-            .order('phase,order') \
-            .execute()
-            
-        if not result.data:
+        instructions = None
+        
+        if surgery_id is not None:
+            tracker = acquire_compliance_tracker(surgery_id)
+            test_requirements, instructions = tracker.open_requirements()
+            if not test_requirements:
+                print("All requirements already satisfied")
+                return {'satisfied': [], 'clarifications': []}
+        else:
+            # Requirements come from the cached catalog, not a per-utterance table read
+            test_requirements = get_requirement_catalog().requirement_texts()
+        
+        if not test_requirements:
             print("No requirements found in database")
             return
-            
-        # Extract requirements from result
-        test_requirements = [item['requirement'] for item in result.data]
         
-        results = process_compliance_requirements(test_requirements, conversation_text)
+        results = process_compliance_requirements(test_requirements, conversation_text, instructions)
         
         if results:
-            # Initialize a list to hold saved results across all requirements
+            # Requirements satisfied by this turn, completed together in one bulk update
             saved_results = []
+            # Requirements needing clarification, sent to Perplexity concurrently
+            clarification_requests = []
             
             for result in results:
                 requirement = result['requirement']
@@ -156,28 +275,23 @@ def test_compliance_processing(conversation_text: str):
                 
                 if status == 'A':
                     print("✓ Requirement directly satisfied")
-                    # Update the requirement status in Supabase
-                    update_success = update_requirement_status(requirement)
                     saved_results.append(requirement)
-                    if update_success:
-                        print("✓ Requirement status updated in database")
-                    else:
-                        print("⚠ Failed to update requirement status in database")
                 elif status == 'B':
                     print("⚠ Requirement needs clarification, querying Perplexity...")
-                    perplexity_response = search_and_answer(
-                        question=requirement,
-                        context=conversation_text,
-                        temperature=0.2
-                    )
-                    print(f"Perplexity response received: {perplexity_response[:100]}...")
-                    # Return results as a structured dictionary instead of concatenating a list with a string
-                    return perplexity_response + " " + ", ".join(saved_results)
+                    clarification_requests.append(requirement)
                 else:  # status == 'C'
                     print("➤ Requirement not relevant to current context")
             
-            # If no "B" status was encountered, you may choose to return the saved results.
-            return saved_results
+            _complete_requirements(saved_results, tracker)
+            answers = search_and_answer_many(clarification_requests, context=conversation_text, temperature=0.2)
+            
+            return {
+                'satisfied': saved_results,
+                'clarifications': [
+                    {'requirement': requirement, 'answer': answers.get(requirement)}
+                    for requirement in clarification_requests
+                ]
+            }
         else:
             print("Test failed: No results received")
             return None
@@ -185,6 +299,9 @@ def test_compliance_processing(conversation_text: str):
     except Exception as e:
         print(f"Error in test compliance processing: {str(e)}")
         return None
+    finally:
+        if tracker is not None:
+            release_compliance_tracker(surgery_id)
 
 if __name__ == "__main__":
     test_compliance_processing() 
\ No newline at end of file
@@ -0,0 +1,191 @@
+import time
+import uuid
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+from .conversation_intake import test_compliance_processing, acquire_compliance_tracker, release_compliance_tracker
+
+# Bounds of the context sent with every evaluation, independent of transcript length
+WINDOW_MAX_UTTERANCES = 20
+WINDOW_MAX_CHARS = 4000
+SUMMARY_MAX_CHARS = 1500
+SUMMARY_LINE_CHARS = 160
+
+# Sessions untouched for this long are dropped
+SESSION_IDLE_TIMEOUT = 4 * 60 * 60
+
+
+class ConversationSession:
+    """
+    Streaming conversation intake for one surgery.
+
+    Utterances are appended to a bounded sliding window. Utterances that fall out
+    of the window are kept, shortened, in a rolling summary whose oldest lines go
+    first, so each evaluation costs O(window) no matter how long the surgery has
+    been running. Requirements confirmed during the session are listed separately
+    and never evicted; there is at most one line per checklist requirement.
+    """
+
+    def __init__(self, session_id: str, surgery_id: Optional[str] = None,
+                 max_utterances: int = WINDOW_MAX_UTTERANCES,
+                 max_chars: int = WINDOW_MAX_CHARS,
+                 summary_max_chars: int = SUMMARY_MAX_CHARS):
+        self.session_id = session_id
+        self.surgery_id = surgery_id or session_id
+        self.max_utterances = max_utterances
+        self.max_chars = max_chars
+        self.summary_max_chars = summary_max_chars
+        self.window = deque()
+        self.window_chars = 0
+        self.summary = deque()
+        self.summary_chars = 0
+        # Confirmed requirements in order, without duplicates
+        self.confirmed = {}
+        self.total_utterances = 0
+        self.last_active = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _add_summary_line(self, line: str):
+        self.summary.append(line)
+        self.summary_chars += len(line)
+        # Oldest summary lines go first once the summary budget is used up
+        while self.summary_chars > self.summary_max_chars and len(self.summary) > 1:
+            self.summary_chars -= len(self.summary.popleft())
+
+    def append(self, utterance: str):
+        """Add an utterance, evicting the oldest ones into the summary when over budget."""
+        utterance = utterance.strip()
+        if not utterance:
+            return
+
+        with self._lock:
+            self.window.append(utterance)
+            self.window_chars += len(utterance)
+            self.total_utterances += 1
+            self.last_active = time.monotonic()
+
+            # The newest utterance always stays, even if it alone exceeds the budget
+            while len(self.window) > 1 and (
+                len(self.window) > self.max_utterances or self.window_chars > self.max_chars
+            ):
+                evicted = self.window.popleft()
+                self.window_chars -= len(evicted)
+                self._add_summary_line(evicted[:SUMMARY_LINE_CHARS])
+
+    def record_satisfied(self, requirements: List[str]):
+        """Keep satisfied requirements in the context once their utterances scroll away."""
+        with self._lock:
+            for requirement in requirements:
+                self.confirmed.setdefault(requirement, None)
+
+    def context(self) -> str:
+        """Build the bounded evaluation context: confirmed requirements, rolling summary and recent window."""
+        with self._lock:
+            parts = []
+            if self.confirmed:
+                parts.append("Confirmed earlier in this surgery:\n" + "\n".join(self.confirmed))
+            if self.summary:
+                parts.append("Earlier in this surgery (summary):\n" + "\n".join(self.summary))
+            recent = "\n".join(self.window)
+
+        if not parts:
+            return recent
+        return "\n\n".join(parts) + f"\n\nRecent conversation:\n{recent}"
+
+    def get_stats(self) -> Dict:
+        """Return the session's window and summary sizes."""
+        with self._lock:
+            return {
+                'session_id': self.session_id,
+                'surgery_id': self.surgery_id,
+                'total_utterances': self.total_utterances,
+                'window_utterances': len(self.window),
+                'window_chars': self.window_chars,
+                'summary_chars': self.summary_chars,
+                'confirmed': len(self.confirmed)
+            }
+
+
+_sessions: Dict[str, ConversationSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def _remove_session(session_id: str) -> bool:
+    """Drop a session and its reference to the surgery's compliance tracker."""
+    session = _sessions.pop(session_id, None)
+    if session is None:
+        return False
+    release_compliance_tracker(session.surgery_id)
+    return True
+
+
+def _expire_idle_sessions():
+    cutoff = time.monotonic() - SESSION_IDLE_TIMEOUT
+    for session_id in [sid for sid, s in _sessions.items() if s.last_active < cutoff]:
+        print(f"Expiring idle conversation session: {session_id}")
+        _remove_session(session_id)
+
+
+def create_session(surgery_id: Optional[str] = None) -> ConversationSession:
+    """Open a new streaming conversation session."""
+    session = ConversationSession(uuid.uuid4().hex, surgery_id)
+    with _sessions_lock:
+        _expire_idle_sessions()
+        _sessions[session.session_id] = session
+        # Keeps the surgery's incremental state alive between evaluations
+        acquire_compliance_tracker(session.surgery_id)
+    print(f"Opened conversation session {session.session_id} for surgery {session.surgery_id}")
+    return session
+
+
+def get_session(session_id: str) -> Optional[ConversationSession]:
+    """Return an open session, or None if it doesn't exist or has expired."""
+    with _sessions_lock:
+        _expire_idle_sessions()
+        session = _sessions.get(session_id)
+        if session is not None:
+            # A session being used is not idle, even before anything is appended
+            session.last_active = time.monotonic()
+        return session
+
+
+def close_session(session_id: str) -> bool:
+    """Close a session, returning False if it wasn't open."""
+    with _sessions_lock:
+        return _remove_session(session_id)
+
+
+def evaluate_session(session: ConversationSession):
+    """Run the compliance check against the session's bounded context."""
+    results = test_compliance_processing(session.context(), session.surgery_id)
+    if results:
+        session.record_satisfied(results['satisfied'])
+    return results
+
+
+def process_utterances(session_id: str, utterances: List[str], evaluate: bool = True):
+    """
+    Append utterances to a session and optionally evaluate the updated context.
+
+    Args:
+        session_id (str): The session to append to
+        utterances (List[str]): New utterances, oldest first
+        evaluate (bool): Run the compliance check after appending
+
+    Returns:
+        The compliance results (None if evaluation was skipped or failed)
+
+    Raises:
+        KeyError: If the session doesn't exist
+    """
+    session = get_session(session_id)
+    if session is None:
+        raise KeyError(session_id)
+
+    for utterance in utterances:
+        session.append(utterance)
+
+    if not evaluate:
+        return None
+    return evaluate_session(session)
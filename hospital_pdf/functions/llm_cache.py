@@ -0,0 +1,285 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import wait
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional
+
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent / 'cache' / 'llm_responses.sqlite'
+
+MEMORY_MAX_ENTRIES = 256
+DISK_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# Request options that change how a call is made but not what it returns
+_TRANSPORT_PARAMS = {'timeout', 'extra_headers'}
+
+
+class LLMResponseCache:
+    """
+    Two-tier cache of model responses keyed by a hash of provider, model, messages and params.
+
+    An in-process LRU sits in front of a sqlite file shared by every process on the
+    host. Entries expire after a TTL, and the disk tier evicts least recently used
+    entries once it grows past its size cap.
+    """
+
+    def __init__(self, path: Optional[str] = None,
+                 memory_max_entries: int = MEMORY_MAX_ENTRIES,
+                 disk_max_bytes: int = DISK_MAX_BYTES,
+                 ttl: float = DEFAULT_TTL_SECONDS):
+        self.path = Path(path or os.getenv('LLM_CACHE_PATH', DEFAULT_CACHE_PATH))
+        self.memory_max_entries = memory_max_entries
+        self.disk_max_bytes = disk_max_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'bypassed': 0, 'evictions': 0}
+
+    @staticmethod
+    def make_key(client, params: Dict) -> str:
+        """Hash the provider endpoint and request params into a cache key."""
+        keyed = {k: v for k, v in params.items() if k not in _TRANSPORT_PARAMS}
+        keyed['base_url'] = str(getattr(client, 'base_url', ''))
+        payload = json.dumps(keyed, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        # Connections must not cross a fork, so reopen per process
+        if self._conn is None or self._conn_pid != os.getpid():
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._conn = sqlite3.connect(str(self.path), timeout=10, check_same_thread=False)
+                self._conn.execute(
+                    'CREATE TABLE IF NOT EXISTS responses ('
+                    'key TEXT PRIMARY KEY, value TEXT, created REAL, accessed REAL, size INTEGER)'
+                )
+                self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+                self._conn.commit()
+                self._conn_pid = os.getpid()
+            except sqlite3.Error as e:
+                logging.error(f"LLM cache disk tier unavailable: {e}")
+                self._conn = None
+        return self._conn
+
+    def _remember(self, key: str, value: str, created: float):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached response, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return entry[0]
+
+            conn = self._db()
+            if conn is not None:
+                try:
+                    row = conn.execute('SELECT value, created FROM responses WHERE key = ?', (key,)).fetchone()
+                    if row is not None and now - row[1] < self.ttl:
+                        conn.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+                        conn.commit()
+                        self._remember(key, row[0], row[1])
+                        self.stats['disk_hits'] += 1
+                        return row[0]
+                    if row is not None:
+                        conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                        conn.commit()
+                except sqlite3.Error as e:
+                    logging.error(f"LLM cache read failed: {e}")
+
+            self._memory.pop(key, None)
+            self.stats['misses'] += 1
+            return None
+
+    def set(self, key: str, value: str):
+        """Store a response in both tiers, evicting old disk entries past the size cap."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            conn = self._db()
+            if conn is None:
+                return
+            try:
+                conn.execute(
+                    'INSERT OR REPLACE INTO responses (key, value, created, accessed, size) VALUES (?, ?, ?, ?, ?)',
+                    (key, value, now, now, len(value.encode('utf-8')))
+                )
+                total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+                if total > self.disk_max_bytes:
+                    self._evict(conn, total)
+                conn.commit()
+            except sqlite3.Error as e:
+                logging.error(f"LLM cache write failed: {e}")
+
+    def _evict(self, conn: sqlite3.Connection, total: int):
+        # Trim to 90% of the cap so eviction doesn't run on every write
+        target = self.disk_max_bytes * 0.9
+        for key, size in conn.execute('SELECT key, size FROM responses ORDER BY accessed').fetchall():
+            if total <= target:
+                break
+            conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._memory.pop(key, None)
+            total -= size
+            self.stats['evictions'] += 1
+
+    def clear(self):
+        """Drop every cached response."""
+        with self._lock:
+            self._memory.clear()
+            conn = self._db()
+            if conn is not None:
+                conn.execute('DELETE FROM responses')
+                conn.commit()
+
+    def record_bypass(self):
+        with self._lock:
+            self.stats['bypassed'] += 1
+
+    def get_stats(self) -> Dict[str, int]:
+        """Return hit/miss counters."""
+        with self._lock:
+            return dict(self.stats, memory_entries=len(self._memory))
+
+
+class RateLimiter:
+    """
+    Token bucket limiting how many provider calls start per minute, across threads.
+
+    Cache hits never reach the provider, so cached_completion only acquires a
+    token on a miss.
+    """
+
+    def __init__(self, requests_per_minute: float, burst: Optional[int] = None):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = burst or max(1, int(requests_per_minute // 10))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    def acquire(self):
+        """Block until a call may start."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+                self.waited += delay
+            time.sleep(delay)
+
+
+def wait_for_fanout(futures: Iterable, max_workers: int, timeout: float):
+    """
+    Wait for provider calls fanned out over a pool of max_workers threads.
+
+    Each call is bounded by its own timeout, but only max_workers of them run at
+    once and the rest queue behind them, so the overall deadline allows one
+    timeout per round of max_workers calls.
+
+    Returns:
+        The (done, not_done) sets from concurrent.futures.wait
+    """
+    futures = list(futures)
+    rounds = -(-len(futures) // max_workers)
+    return wait(futures, timeout=timeout * rounds + 1)
+
+
+_cache = LLMResponseCache()
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """Return the process-wide response cache."""
+    return _cache
+
+
+def cached_completion(client, bypass_cache: bool = False, cache: Optional[LLMResponseCache] = None,
+                      limiter: Optional[RateLimiter] = None, **params) -> str:
+    """
+    Run a chat completion through the response cache.
+
+    Args:
+        client: An OpenAI-compatible client (OpenAI, Perplexity, ...)
+        bypass_cache (bool): Skip the cache lookup and always call the provider.
+            The fresh response still replaces the cached one.
+        cache (LLMResponseCache, optional): Cache to use instead of the shared one
+        limiter (RateLimiter, optional): Acquired before calling the provider on a miss
+        **params: Arguments for client.chat.completions.create
+
+    Returns:
+        str: The content of the first choice
+    """
+    cache = cache or _cache
+    key = cache.make_key(client, params)
+
+    if bypass_cache:
+        cache.record_bypass()
+    else:
+        cached = cache.get(key)
+        if cached is not None:
+            print(f"LLM cache hit for {params.get('model')}")
+            return cached
+
+    if limiter is not None:
+        limiter.acquire()
+    completion = client.chat.completions.create(**params)
+    content = completion.choices[0].message.content
+    if content is not None:
+        cache.set(key, content)
+    return content
+
+
+def stream_cached_completion(client, bypass_cache: bool = False, cache: Optional[LLMResponseCache] = None,
+                             limiter: Optional[RateLimiter] = None, **params) -> Iterator[str]:
+    """
+    Streaming variant of cached_completion: yields the response text as it arrives.
+
+    A cache hit is yielded as a single piece. On a miss the call is made with
+    stream=True and the full text is cached once the stream completes, so a
+    stream abandoned part way through is never cached.
+
+    Yields:
+        str: Content deltas of the first choice
+    """
+    cache = cache or _cache
+    key = cache.make_key(client, params)
+
+    if bypass_cache:
+        cache.record_bypass()
+    else:
+        cached = cache.get(key)
+        if cached is not None:
+            print(f"LLM cache hit for {params.get('model')}")
+            yield cached
+            return
+
+    if limiter is not None:
+        limiter.acquire()
+    parts = []
+    for chunk in client.chat.completions.create(stream=True, **params):
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            yield delta
+
+    if parts:
+        cache.set(key, "".join(parts))
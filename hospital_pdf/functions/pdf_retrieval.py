@@ -0,0 +1,238 @@
+import re
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .pdf_text import PDF_TEXT_CACHE_DIR, extract_pdf_pages, pdf_cache_key
+
+CHUNK_WORDS = 200
+CHUNK_OVERLAP = 40
+DEFAULT_TOP_K = 5
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+INDEX_SUFFIX = '.bm25.npz'
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens used for both indexing and queries."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def chunk_pages(pages: List[str], chunk_words: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP):
+    """
+    Split page texts into overlapping word windows.
+
+    Returns:
+        Tuple[List[str], List[int]]: Chunk texts and their 1-based page numbers
+    """
+    texts, page_numbers = [], []
+    step = max(1, chunk_words - overlap)
+    for page_number, page_text in enumerate(pages, start=1):
+        words = page_text.split()
+        for start in range(0, max(len(words) - overlap, 1), step):
+            chunk = " ".join(words[start:start + chunk_words])
+            if chunk:
+                texts.append(chunk)
+                page_numbers.append(page_number)
+    return texts, page_numbers
+
+
+class PdfRetrievalIndex:
+    """
+    BM25 index over chunks of a PDF's pages.
+
+    Postings are stored term-major in flat NumPy arrays (a CSC-style sparse
+    matrix), so scoring a query only touches the postings of its terms.
+    """
+
+    def __init__(self, source_key: str, terms: np.ndarray, term_indptr: np.ndarray,
+                 doc_ids: np.ndarray, term_freqs: np.ndarray, doc_lengths: np.ndarray,
+                 chunks: np.ndarray, pages: np.ndarray):
+        self.source_key = source_key
+        self.terms = terms
+        self.term_indptr = term_indptr
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.chunks = chunks
+        self.pages = pages
+        self.vocabulary = {term: i for i, term in enumerate(terms.tolist())}
+
+        doc_freqs = np.diff(term_indptr)
+        num_docs = len(chunks)
+        self.idf = np.log(1 + (num_docs - doc_freqs + 0.5) / (doc_freqs + 0.5))
+        self.avg_doc_length = float(doc_lengths.mean()) if num_docs else 0.0
+
+    @classmethod
+    def build(cls, pages: List[str], source_key: str = '') -> 'PdfRetrievalIndex':
+        """Chunk the pages and build the term-major postings."""
+        texts, page_numbers = chunk_pages(pages)
+        vocabulary: Dict[str, int] = {}
+        postings_terms, postings_docs, postings_freqs = [], [], []
+        doc_lengths = np.zeros(len(texts), dtype=np.int32)
+
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths[doc_id] = len(tokens)
+            counts: Dict[int, int] = {}
+            for token in tokens:
+                term_id = vocabulary.setdefault(token, len(vocabulary))
+                counts[term_id] = counts.get(term_id, 0) + 1
+            postings_terms.extend(counts.keys())
+            postings_docs.extend([doc_id] * len(counts))
+            postings_freqs.extend(counts.values())
+
+        postings_terms = np.asarray(postings_terms, dtype=np.int32)
+        order = np.argsort(postings_terms, kind='stable')
+        term_indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(postings_terms, minlength=len(vocabulary)), out=term_indptr[1:])
+
+        terms = np.empty(len(vocabulary), dtype=object)
+        for term, term_id in vocabulary.items():
+            terms[term_id] = term
+
+        return cls(
+            source_key=source_key,
+            terms=terms.astype(str) if len(terms) else np.array([], dtype=str),
+            term_indptr=term_indptr,
+            doc_ids=np.asarray(postings_docs, dtype=np.int32)[order],
+            term_freqs=np.asarray(postings_freqs, dtype=np.float32)[order],
+            doc_lengths=doc_lengths,
+            chunks=np.array(texts, dtype=str),
+            pages=np.asarray(page_numbers, dtype=np.int32)
+        )
+
+    def save(self, path: Path):
+        """Persist the index as a pickle-free .npz file."""
+        with open(path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                source_key=np.array(self.source_key),
+                terms=self.terms,
+                term_indptr=self.term_indptr,
+                doc_ids=self.doc_ids,
+                term_freqs=self.term_freqs,
+                doc_lengths=self.doc_lengths,
+                chunks=self.chunks,
+                pages=self.pages
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> 'PdfRetrievalIndex':
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                source_key=str(data['source_key']),
+                terms=data['terms'],
+                term_indptr=data['term_indptr'],
+                doc_ids=data['doc_ids'],
+                term_freqs=data['term_freqs'],
+                doc_lengths=data['doc_lengths'],
+                chunks=data['chunks'],
+                pages=data['pages']
+            )
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def search(self, query: str, top_k: int = DEFAULT_TOP_K) -> List[Dict]:
+        """
+        Return the best matching chunks for a query.
+
+        Returns:
+            List[Dict]: Chunks with 'text', 'page' and 'score', best first
+        """
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.term_indptr[term_id], self.term_indptr[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.term_freqs[start:end]
+            norm = K1 * (1 - B + B * self.doc_lengths[docs] / self.avg_doc_length)
+            scores[docs] += self.idf[term_id] * tf * (K1 + 1) / (tf + norm)
+
+        top_k = min(top_k, len(scores))
+        if top_k == 0:
+            return []
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return [
+            {'text': str(self.chunks[i]), 'page': int(self.pages[i]), 'score': float(scores[i])}
+            for i in best if scores[i] > 0
+        ]
+
+
+_indexes: Dict[str, PdfRetrievalIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def _index_paths(pdf_path: str, source_key: str) -> List[Path]:
+    # The shared cache directory first, so building an index doesn't leave files in the
+    # source tree; next to the PDF only if the cache isn't writable (or one was shipped there)
+    return [PDF_TEXT_CACHE_DIR / f"{source_key}{INDEX_SUFFIX}", Path(pdf_path).with_suffix(INDEX_SUFFIX)]
+
+
+def get_pdf_index(pdf_path: str) -> PdfRetrievalIndex:
+    """Load the persisted index for a PDF, building and saving it if missing or stale."""
+    source_key = pdf_cache_key(pdf_path)
+
+    with _indexes_lock:
+        index = _indexes.get(pdf_path)
+        if index is not None and index.source_key == source_key:
+            return index
+
+    index = None
+    for path in _index_paths(pdf_path, source_key):
+        if path.exists():
+            try:
+                candidate = PdfRetrievalIndex.load(path)
+                if candidate.source_key == source_key:
+                    index = candidate
+                    break
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f"Ignoring unreadable retrieval index {path}: {e}")
+
+    if index is None:
+        print(f"Building retrieval index for {pdf_path}...")
+        index = PdfRetrievalIndex.build(extract_pdf_pages(pdf_path), source_key)
+        for path in _index_paths(pdf_path, source_key):
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                index.save(path)
+                print(f"Saved retrieval index to {path}")
+                break
+            except OSError as e:
+                logging.warning(f"Could not save retrieval index to {path}: {e}")
+
+    with _indexes_lock:
+        _indexes[pdf_path] = index
+    return index
+
+
+def retrieve_pdf_context(pdf_path: str, query: str, top_k: int = DEFAULT_TOP_K) -> Optional[str]:
+    """
+    Return the top-k chunks of a PDF for a query, each prefixed with its page citation.
+
+    Returns:
+        Optional[str]: The formatted excerpts, or None when the document is small enough
+            (or the query matches nothing) and the full text should be sent instead
+    """
+    index = get_pdf_index(pdf_path)
+    if len(index) <= top_k:
+        return None
+
+    results = index.search(query, top_k)
+    if not results:
+        return None
+
+    print(f"Retrieved {len(results)}/{len(index)} chunks from pages {sorted({r['page'] for r in results})}")
+    return "\n\n".join(f"[Page {r['page']}] {r['text']}" for r in results)
@@ -0,0 +1,108 @@
+import os
+import json
+import hashlib
+import logging
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List
+
+import PyPDF2
+
+PDF_TEXT_CACHE_DIR = Path(os.getenv('PDF_TEXT_CACHE_DIR', Path(__file__).parent.parent / 'cache' / 'pdf_text'))
+
+# Documents with at least this many pages are split across a process pool
+PARALLEL_PAGE_THRESHOLD = 40
+MAX_WORKERS = min(8, os.cpu_count() or 1)
+# Extraction workers are spawned rather than forked: the Flask server's other
+# threads may hold locks at fork time, and extraction only needs PyPDF2
+_EXTRACT_CONTEXT = multiprocessing.get_context('spawn')
+
+# Recently used documents are also kept in memory
+MEMORY_MAX_DOCUMENTS = 16
+
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+
+
+def pdf_cache_key(pdf_path: str) -> str:
+    """Key a PDF by absolute path, modification time and size."""
+    stat = os.stat(pdf_path)
+    identity = f"{os.path.abspath(pdf_path)}:{stat.st_mtime_ns}:{stat.st_size}"
+    return hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+
+def _extract_page_range(pdf_path: str, start: int, end: int) -> List[str]:
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [pdf_reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def _extract_pages(pdf_path: str) -> List[str]:
+    with open(pdf_path, 'rb') as file:
+        total_pages = len(PyPDF2.PdfReader(file).pages)
+
+    workers = min(MAX_WORKERS, total_pages // PARALLEL_PAGE_THRESHOLD + 1)
+    if workers <= 1:
+        return _extract_page_range(pdf_path, 0, total_pages)
+
+    print(f"Extracting {total_pages} pages across {workers} processes...")
+    step = -(-total_pages // workers)
+    ranges = [(start, min(start + step, total_pages)) for start in range(0, total_pages, step)]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_EXTRACT_CONTEXT) as executor:
+        chunks = executor.map(_extract_page_range, [pdf_path] * len(ranges), *zip(*ranges))
+        return [text for chunk in chunks for text in chunk]
+
+
+def extract_pdf_pages(pdf_path: str) -> List[str]:
+    """
+    Return the text of every page of a PDF, using the on-disk cache when possible.
+
+    Args:
+        pdf_path (str): Path to the PDF file
+
+    Returns:
+        List[str]: Extracted text per page, in page order
+    """
+    key = pdf_cache_key(pdf_path)
+
+    with _memory_lock:
+        if key in _memory:
+            _memory.move_to_end(key)
+            return _memory[key]
+
+    cache_file = PDF_TEXT_CACHE_DIR / f"{key}.json"
+    pages = None
+    if cache_file.exists():
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                pages = json.load(f)['pages']
+            print(f"Loaded {len(pages)} cached pages for {pdf_path}")
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Ignoring unreadable PDF text cache {cache_file}: {e}")
+
+    if pages is None:
+        print(f"Extracting text from {pdf_path}...")
+        pages = _extract_pages(pdf_path)
+        try:
+            PDF_TEXT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({'path': os.path.abspath(pdf_path), 'pages': pages}, f)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            logging.warning(f"Could not write PDF text cache {cache_file}: {e}")
+
+    with _memory_lock:
+        _memory[key] = pages
+        while len(_memory) > MEMORY_MAX_DOCUMENTS:
+            _memory.popitem(last=False)
+    return pages
+
+
+def extract_pdf_text(pdf_path: str) -> str:
+    """Return the whole text of a PDF, one newline-terminated block per page."""
+    pages = extract_pdf_pages(pdf_path)
+    return "\n".join(pages) + "\n" if pages else ""
@@ -1,6 +1,9 @@
 from openai import OpenAI
 import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
+from .llm_cache import cached_completion, wait_for_fanout
 
 # Load environment variables
 load_dotenv()
@@ -11,7 +14,13 @@ client = OpenAI(
     base_url="https://api.perplexity.ai",
 )
 
-def search_and_answer(question: str, context: str = "", temperature: float = 0.2) -> str:
+# Clarification requests are fanned out on a bounded pool, each with its own timeout
+MAX_CONCURRENT_REQUESTS = 4
+REQUEST_TIMEOUT = 20.0
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS, thread_name_prefix='perplexity')
+
+def search_and_answer(question: str, context: str = "", temperature: float = 0.2,
+                      timeout: float = REQUEST_TIMEOUT, bypass_cache: bool = False) -> str:
     """
     Uses Perplexity's Sonar model to answer a question with optional context.
     
@@ -19,6 +28,8 @@ def search_and_answer(question: str, context: str = "", temperature: float = 0.2
         question (str): The question to be answered
         context (str, optional): Additional context to help guide the answer
         temperature (float, optional): Controls randomness in the response (0.0-2.0)
+        timeout (float, optional): Seconds to wait for the API before giving up
+        bypass_cache (bool, optional): Always call the API instead of reusing a cached answer
         
     Returns:
         str: The model's response or None if there's an error
@@ -42,17 +53,56 @@ def search_and_answer(question: str, context: str = "", temperature: float = 0.2
             }
         ]
         
-        response = client.chat.completions.create(
+        answer = cached_completion(
+            client,
+            bypass_cache=bypass_cache,
             model="llama-3.1-sonar-small-128k-chat",
             messages=messages,
             temperature=temperature,
             top_p=0.9,
-            stream=False
+            stream=False,
+            timeout=timeout
         )
         
         print("Received response from Perplexity API")
-        return response.choices[0].message.content
+        return answer
         
     except Exception as e:
         print(f"Error in Perplexity API call: {str(e)}")
-        return None
\ No newline at end of file
+        return None
+
+def search_and_answer_many(questions: List[str], context: str = "", temperature: float = 0.2,
+                           timeout: float = REQUEST_TIMEOUT) -> Dict[str, Optional[str]]:
+    """
+    Answers several questions concurrently against the same context.
+    
+    Args:
+        questions (List[str]): The questions to be answered
+        context (str, optional): Additional context shared by every question
+        temperature (float, optional): Controls randomness in the response (0.0-2.0)
+        timeout (float, optional): Per-request timeout in seconds
+        
+    Returns:
+        Dict[str, Optional[str]]: Answer per question, None for failed or timed-out requests
+    """
+    questions = list(dict.fromkeys(questions))
+    if not questions:
+        return {}
+        
+    print(f"Fanning out {len(questions)} Perplexity requests...")
+    futures = {
+        question: _executor.submit(search_and_answer, question, context, temperature, timeout)
+        for question in questions
+    }
+    
+    wait_for_fanout(futures.values(), MAX_CONCURRENT_REQUESTS, timeout)
+    
+    answers = {}
+    for question, future in futures.items():
+        if future.done():
+            answers[question] = future.result()
+        else:
+            future.cancel()
+            print(f"Perplexity request timed out for question: {question[:50]}...")
+            answers[question] = None
+    return answers
@@ -3,28 +3,54 @@ from openai import OpenAI
 from PIL import Image
 from dotenv import load_dotenv
 import glob
-import base64
-from supabase import create_client
-from datetime import datetime
+import shutil
+import tempfile
+from contextlib import ExitStack
+from functions.supabase_functions.client_pool import get_supabase_client
+from functions.llm_cache import cached_completion, wait_for_fanout
+from functions.preprocessing.image_prep import PreparedImage, prepare_images
+from functions.preprocessing.frame_dedupe import dedupe_frames, get_frame_set_cache
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+import time
+import hashlib
+import threading
 
 load_dotenv()
 
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+# Uploads larger than this are buffered on disk rather than in memory
+SPOOL_THRESHOLD = 4 * 1024 * 1024
+
+def _drop_unreadable(images, names, rejected=None):
+    """
+    Drop images that couldn't be decoded into a format the vision model accepts.
+
+    prepare_image passes undecodable input through as application/octet-stream,
+    which the API rejects, failing the whole request or group.
+    """
+    kept = []
+    for image, name in zip(images, names):
+        if image.mime_type.startswith('image/'):
+            kept.append(image)
+        else:
+            print(f"Skipping unreadable image: {name}")
+            if rejected is not None:
+                rejected.append(name)
+    return kept
+
 def load_and_encode_images(path, max_images=10):
-    """Load and encode images from folder or single file"""
-    encoded_images = []
-    
+    """
+    Load and preprocess images from folder or single file
+
+    Returns:
+        List[PreparedImage]: Downscaled, metadata-free images with their MIME types
+    """
     print(f"Processing path: {path}")
     
     # Check if path is a directory or file
     if os.path.isfile(path):
-        if path.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')):
-            try:
-                with open(path, "rb") as image_file:
-                    encoded = base64.b64encode(image_file.read()).decode('utf-8')
-                    encoded_images.append(encoded)
-                    print(f"Successfully encoded: {path}")
-            except Exception as e:
-                print(f"Error loading image {path}: {e}")
+        image_files = [path] if path.lower().endswith(IMAGE_EXTENSIONS) else []
     else:
         image_files = glob.glob(os.path.join(path, "*.jpg")) + \
                      glob.glob(os.path.join(path, "*.jpeg")) + \
@@ -32,49 +58,139 @@ def load_and_encode_images(path, max_images=10):
                      glob.glob(os.path.join(path, "*.webp"))
         
         print(f"Found files in directory: {image_files}")
-        
-        for img_path in image_files[:max_images]:
+    
+    image_files = image_files[:max_images]
+    return _drop_unreadable(prepare_images(image_files), image_files)
+
+def encode_uploaded_images(files, max_images=10, spool_threshold=SPOOL_THRESHOLD, rejected=None):
+    """
+    Preprocess uploaded images (e.g. werkzeug FileStorage objects) without touching a shared directory.
+
+    Each upload is copied into a private SpooledTemporaryFile, which stays in
+    memory below spool_threshold and rolls over to an anonymous temp file above
+    it, then decoded, downscaled and re-encoded on the preprocessing pool.
+    Uploads that aren't images, or that can't be decoded, are left out.
+
+    Args:
+        files: Uploads with .filename, .mimetype and .stream attributes
+        max_images (int): Maximum number of images to encode
+        spool_threshold (int): Bytes above which an upload is buffered on disk
+        rejected (list, optional): Filled with the filenames of the uploads left out
+
+    Returns:
+        List[PreparedImage]: Preprocessed images, in upload order
+    """
+    with ExitStack() as stack:
+        buffers = []
+        names = []
+        for upload in files:
+            if len(buffers) >= max_images:
+                print(f"Ignoring images beyond the first {max_images}")
+                break
+
+            filename = upload.filename or ''
+            if not (filename.lower().endswith(IMAGE_EXTENSIONS) or (upload.mimetype or '').startswith('image/')):
+                print(f"Skipping non-image upload: {filename}")
+                if rejected is not None:
+                    rejected.append(filename)
+                continue
+
             try:
-                with open(img_path, "rb") as image_file:
-                    encoded = base64.b64encode(image_file.read()).decode('utf-8')
-                    encoded_images.append(encoded)
-                    print(f"Successfully encoded: {img_path}")
+                buffer = stack.enter_context(tempfile.SpooledTemporaryFile(max_size=spool_threshold))
+                shutil.copyfileobj(upload.stream, buffer)
+                buffers.append(buffer)
+                names.append(filename)
             except Exception as e:
-                print(f"Error loading image {img_path}: {e}")
-    
-    return encoded_images
+                print(f"Error loading image {filename}: {e}")
+                if rejected is not None:
+                    rejected.append(filename)
 
-def update_supabase(description):
-    """Update Supabase table with analysis"""
-    supabase = create_client(
-        os.getenv('SUPABASE_URL'),
-        os.getenv('SUPABASE_KEY')
-    )
-    
-    # Clear the table
-    print("Clearing previous data...")
-    supabase.table('preprocessing').delete().neq('id', 0).execute()
+        return _drop_unreadable(prepare_images(buffers), names, rejected)
+
+# Results are appended per operating room; see preprocessing_results.sql for the schema
+DEFAULT_ROOM_ID = os.getenv('PREPROCESSING_ROOM_ID', 'default')
+LATEST_VIEW = 'preprocessing_latest'
+# Rows kept per room by background compaction, and the minimum gap between runs
+COMPACTION_KEEP_PER_ROOM = int(os.getenv('PREPROCESSING_KEEP_PER_ROOM', '20'))
+COMPACTION_INTERVAL_SECONDS = 10 * 60
+_compaction_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='preprocessing-compaction')
+_compaction_lock = threading.Lock()
+_last_compaction = 0.0
+
+def _compact_results():
+    try:
+        supabase = get_supabase_client('SUPABASE_KEY')
+        removed = supabase.rpc('compact_preprocessing', {'keep_per_room': COMPACTION_KEEP_PER_ROOM}).execute().data
+        print(f"Compacted preprocessing results: {removed} old rows removed")
+    except Exception as e:
+        print(f"Error compacting preprocessing results: {e}")
+
+def _schedule_compaction():
+    """Compact old rows in the background, at most once per interval per process."""
+    global _last_compaction
+    with _compaction_lock:
+        now = time.monotonic()
+        if _last_compaction and now - _last_compaction < COMPACTION_INTERVAL_SECONDS:
+            return
+        _last_compaction = now
+    _compaction_executor.submit(_compact_results)
+
+def update_supabase(description, room_id=None, surgery_id=None):
+    """
+    Record an analysis for an operating room.
+
+    Rows are appended rather than replacing the table, so each room keeps its own
+    history and concurrent rooms don't overwrite each other. The write is an
+    upsert on (room_id, analysis_key), so retrying the same result doesn't add a
+    row. created_at is set on every write, so an analysis seen again becomes the
+    room's latest row again (and the newest for compaction), even if the same
+    text was stored earlier. Old rows are compacted in the background.
+
+    Args:
+        description (str): The analysis text
+        room_id (str, optional): Operating room the images came from
+        surgery_id (optional): Surgery the analysis belongs to
+    """
+    supabase = get_supabase_client('SUPABASE_KEY')
+    room_id = room_id or DEFAULT_ROOM_ID
+    analysis_key = hashlib.sha256(f"{room_id}\0{surgery_id}\0{description}".encode('utf-8')).hexdigest()
     
-    # Insert new description
-    print("Uploading new analysis...")
+    print(f"Uploading new analysis for room {room_id}...")
     data = {
-        'description': description
+        'description': description,
+        'room_id': room_id,
+        'surgery_id': surgery_id,
+        'analysis_key': analysis_key,
+        # Set explicitly: the column default only applies on insert, not on conflict update
+        'created_at': datetime.now(timezone.utc).isoformat()
     }
-    result = supabase.table('preprocessing').insert(data).execute()
+    result = supabase.table('preprocessing').upsert(data, on_conflict='room_id,analysis_key').execute()
     print("Successfully updated Supabase")
+    
+    _schedule_compaction()
     return result
 
-def analyze_pre_surgery_compliance(encoded_images):
-    """Analyze pre-surgery images for compliance issues"""
-    client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-    
-    messages = [
-        {
-            "role": "user",
-            "content": [
-                {
-                    "type": "text",
-                    "text": """You are a medical compliance expert analyzing a pre-surgery scene. Provide a detailed analysis in two parts:
+def get_latest_preprocessing(room_id=None):
+    """
+    Read the most recent analysis per room from the latest-per-room view.
+
+    Args:
+        room_id (str, optional): Only return this room's latest analysis
+
+    Returns:
+        List[dict]: One row per room, or None if the read failed
+    """
+    try:
+        supabase = get_supabase_client('SUPABASE_KEY')
+        query = supabase.table(LATEST_VIEW).select('id,room_id,surgery_id,description,created_at')
+        if room_id is not None:
+            query = query.eq('room_id', room_id)
+        return query.execute().data
+    except Exception as e:
+        print(f"Error fetching latest preprocessing results: {e}")
+        return None
+
+PRE_SURGERY_PROMPT = """You are a medical compliance expert analyzing a pre-surgery scene. Provide a detailed analysis in two parts:
 
 Part 1 - Scene Description:
 List everything you observe in the scene, including:
@@ -95,26 +211,201 @@ Based on what you observed above, list:
 Be extremely specific and detailed. Describe exactly what you see.
 Do not make recommendations or use hypothetical language.
 Do not say "I'm unable to analyze" - just describe what is visible in the image."""
-                }
-            ]
-        }
-    ]
-    
+
+# Inputs with fewer images than this go out as one request
+PARALLEL_MIN_IMAGES = 4
+IMAGES_PER_GROUP = 2
+MAX_CONCURRENT_VISION_REQUESTS = 4
+VISION_REQUEST_TIMEOUT = 45.0
+GROUP_MAX_TOKENS = 600
+MERGE_MODEL = "gpt-4o-mini"
+MERGE_MAX_TOKENS = 1500
+_vision_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_VISION_REQUESTS, thread_name_prefix='vision')
+
+def _image_url(encoded_image):
+    # Plain base64 strings are still accepted and assumed to be JPEG
+    if isinstance(encoded_image, PreparedImage):
+        return encoded_image.data_url
+    return f"data:image/jpeg;base64,{encoded_image}"
+
+def _vision_messages(text, encoded_images):
+    content = [{"type": "text", "text": text}]
     for encoded_image in encoded_images:
-        messages[0]["content"].append({
+        content.append({
             "type": "image_url",
-            "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}
+            "image_url": {"url": _image_url(encoded_image)}
         })
+    return [{"role": "user", "content": content}]
+
+def _analyze_group(client, encoded_images, view, views, bypass_cache, timeout):
+    """Analyze one group of images; returns the analysis and the seconds it took."""
+    start = time.perf_counter()
+    text = (f"These images show view {view} of {views} of the same pre-surgery scene.\n\n"
+            f"{PRE_SURGERY_PROMPT}")
+    analysis = cached_completion(
+        client,
+        bypass_cache=bypass_cache,
+        model="gpt-4o",
+        messages=_vision_messages(text, encoded_images),
+        max_tokens=GROUP_MAX_TOKENS,
+        timeout=timeout
+    )
+    return analysis, time.perf_counter() - start
+
+def _analyze_in_parallel(client, encoded_images, bypass_cache, timings, timeout=VISION_REQUEST_TIMEOUT,
+                         image_indices=None):
+    """
+    Analyze groups of images concurrently, then merge the results into one two-part analysis.
+
+    Groups that fail or time out are left out of the merge. Each group's record in
+    timings['groups'] lists its images by their position in image_indices (the
+    caller's original order), defaulting to their position in encoded_images.
+
+    Returns:
+        Tuple[str, bool]: The analysis, and whether every group contributed to it
+
+    Raises:
+        RuntimeError: If no group could be analyzed
+    """
+    if image_indices is None:
+        image_indices = list(range(len(encoded_images)))
+    groups = [encoded_images[i:i + IMAGES_PER_GROUP] for i in range(0, len(encoded_images), IMAGES_PER_GROUP)]
+    print(f"Analyzing {len(encoded_images)} images in {len(groups)} parallel requests...")
+    futures = [
+        _vision_executor.submit(_analyze_group, client, group, view, len(groups), bypass_cache, timeout)
+        for view, group in enumerate(groups, start=1)
+    ]
+
+    wait_for_fanout(futures, MAX_CONCURRENT_VISION_REQUESTS, timeout)
+
+    analyses = []
+    timings['groups'] = []
+    for view, future in enumerate(futures, start=1):
+        first_image = (view - 1) * IMAGES_PER_GROUP
+        record = {'images': image_indices[first_image:first_image + len(groups[view - 1])]}
+        if not future.done():
+            future.cancel()
+            record['status'] = 'timeout'
+        elif future.exception() is not None:
+            record['status'] = 'error'
+            record['error'] = str(future.exception())
+        else:
+            analysis, record['seconds'] = future.result()
+            record['status'] = 'ok'
+            analyses.append(analysis)
+        timings['groups'].append(record)
+        print(f"View {view}: {record['status']}" + (f" in {record['seconds']:.1f}s" if 'seconds' in record else ""))
+
+    if not analyses:
+        raise RuntimeError("every image group failed or timed out")
+    complete = len(analyses) == len(groups)
+    if len(analyses) == 1:
+        return analyses[0], complete
+
+    # Cheap text-only merge of the per-view analyses
+    start = time.perf_counter()
+    views = "\n\n".join(f"### View {i}\n{analysis}" for i, analysis in enumerate(analyses, start=1))
+    merged = cached_completion(
+        client,
+        bypass_cache=bypass_cache,
+        model=MERGE_MODEL,
+        messages=[{
+            "role": "user",
+            "content": (
+                "The following are analyses of different views of the same pre-surgery scene.\n\n"
+                f"{views}\n\n"
+                "Merge them into a single analysis with exactly two parts, "
+                "'Part 1 - Scene Description' and 'Part 2 - Compliance Analysis', in the same style. "
+                "Combine duplicate observations, keep every specific detail, violation and missing element, "
+                "and do not add anything that is not in the analyses."
+            )
+        }],
+        max_tokens=MERGE_MAX_TOKENS
+    )
+    timings['merge'] = time.perf_counter() - start
+    return merged, complete
+
+def analysis_status(timings):
+    """
+    Summarize whether a successful analysis covered every image.
+
+    Args:
+        timings (dict): The timings filled in by analyze_pre_surgery_compliance
+
+    Returns:
+        dict: 'partial' (True if the analysis left out some image groups) and the
+            'failed_groups' with their status and upload indices of their images
+    """
+    failed = [group for group in timings.get('groups', []) if group['status'] != 'ok']
+    return {'partial': timings.get('partial', False), 'failed_groups': failed}
+
+def analyze_pre_surgery_compliance(encoded_images, bypass_cache=False, dedupe=True, parallel=None, timings=None,
+                                   room_id=None, surgery_id=None):
+    """
+    Analyze pre-surgery images for compliance issues
+
+    Args:
+        encoded_images (List): PreparedImage objects, or base64 JPEG strings
+        bypass_cache (bool): Always call the model instead of reusing a cached analysis
+        dedupe (bool): Drop near-duplicate PreparedImage frames before the call, and
+            reuse the analysis of a perceptually identical frame set seen earlier
+            in the same room and surgery
+        parallel (bool, optional): Analyze small groups of images concurrently and
+            merge the results. Defaults to doing so for PARALLEL_MIN_IMAGES or more images.
+        timings (dict, optional): Filled with per-group latencies ('groups'), the
+            'merge' step, or the 'single' request, and whether the analysis is
+            'partial'. Pass it to analysis_status to find out which views are missing.
+        room_id (str, optional): Operating room the images came from
+        surgery_id (optional): Surgery the images belong to
+
+    Returns:
+        str: The analysis, or None if it failed (including every image group failing)
+    """
+    if timings is None:
+        timings = {}
+    timings['partial'] = False
+    cache_scope = (room_id or DEFAULT_ROOM_ID, surgery_id)
+
+    frame_hashes = None
+    # Positions of the analyzed images in the caller's list, which dedupe thins out
+    image_indices = list(range(len(encoded_images)))
+    if dedupe and encoded_images and all(isinstance(image, PreparedImage) for image in encoded_images):
+        encoded_images, frame_hashes, image_indices = dedupe_frames(encoded_images)
+        if frame_hashes is not None and not bypass_cache:
+            cached = get_frame_set_cache().get(cache_scope, frame_hashes)
+            if cached is not None:
+                print("Reusing analysis of a previously seen frame set")
+                return cached
+
+    client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    if parallel is None:
+        parallel = len(encoded_images) >= PARALLEL_MIN_IMAGES
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            max_tokens=500
-        )
-        return response.choices[0].message.content
+        complete = True
+        if parallel:
+            analysis, complete = _analyze_in_parallel(client, encoded_images, bypass_cache, timings,
+                                                      image_indices=image_indices)
+        else:
+            start = time.perf_counter()
+            analysis = cached_completion(
+                client,
+                bypass_cache=bypass_cache,
+                model="gpt-4o",
+                messages=_vision_messages(PRE_SURGERY_PROMPT, encoded_images),
+                max_tokens=500
+            )
+            timings['single'] = time.perf_counter() - start
+        timings['partial'] = not complete
+        # A merge missing some views must not be reused for later frame sets
+        if analysis and complete and frame_hashes is not None:
+            get_frame_set_cache().set(cache_scope, frame_hashes, analysis)
+        elif not complete:
+            print("Partial analysis: some views failed, not caching it")
+        return analysis
     except Exception as e:
-        return f"Error analyzing images: {e}"
+        print(f"Error analyzing images: {e}")
+        return None
 
 def main():
     load_dotenv()
@@ -136,6 +427,9 @@ def main():
     
     # Get analysis
     analysis = analyze_pre_surgery_compliance(encoded_images)
+    if not analysis:
+        print("Analysis failed; nothing recorded")
+        return
     
     # Update Supabase
     update_supabase(analysis)
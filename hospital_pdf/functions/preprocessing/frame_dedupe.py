@@ -0,0 +1,167 @@
+import os
+import io
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .image_prep import PreparedImage
+
+HASH_SIZE = 8
+# Fraction of the 128 hash bits (aHash + dHash) two frames must share to count as duplicates
+SIMILARITY_THRESHOLD = float(os.getenv('FRAME_SIMILARITY_THRESHOLD', '0.9'))
+# Reusing a stored analysis needs far closer frames than dropping a duplicate
+# from one burst: at most 1 of 128 bits may differ by default
+REUSE_SIMILARITY_THRESHOLD = float(os.getenv('FRAME_REUSE_SIMILARITY_THRESHOLD', '0.985'))
+# Side of the grayscale thumbnail used for hashing and sharpness
+THUMBNAIL_SIZE = 128
+
+ANALYSIS_CACHE_ENTRIES = 256
+ANALYSIS_CACHE_TTL_SECONDS = 60 * 60
+
+
+def frame_signature(image: PreparedImage) -> Tuple[np.ndarray, float]:
+    """
+    Perceptual hash and informativeness of a frame.
+
+    Returns:
+        Tuple[np.ndarray, float]: 128 hash bits (64-bit aHash followed by 64-bit
+            dHash) and the variance of the Laplacian, a sharpness/detail score
+    """
+    with Image.open(io.BytesIO(image.data)) as frame:
+        frame.draft('L', (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        gray = frame.convert('L')
+        gray.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+
+    average = np.asarray(gray.resize((HASH_SIZE, HASH_SIZE), Image.BILINEAR), dtype=np.float32)
+    a_hash = average > average.mean()
+
+    gradient = np.asarray(gray.resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR), dtype=np.float32)
+    d_hash = gradient[:, 1:] > gradient[:, :-1]
+
+    pixels = np.asarray(gray, dtype=np.float32)
+    laplacian = (pixels[1:-1, :-2] + pixels[1:-1, 2:] + pixels[:-2, 1:-1] + pixels[2:, 1:-1]
+                 - 4 * pixels[1:-1, 1:-1])
+
+    return np.concatenate([a_hash.ravel(), d_hash.ravel()]), float(laplacian.var())
+
+
+def hash_distances(hashes: np.ndarray, others: np.ndarray) -> np.ndarray:
+    """Pairwise Hamming distances between two stacks of hash bit vectors."""
+    return (hashes[:, None, :] != others[None, :, :]).sum(axis=2)
+
+
+def dedupe_frames(images: List[PreparedImage], threshold: float = SIMILARITY_THRESHOLD):
+    """
+    Drop near-duplicate frames, keeping the most informative frame of each cluster.
+
+    Frames are clustered greedily in order: a frame joins the first cluster whose
+    leader it matches at or above the similarity threshold, and otherwise starts a
+    new cluster. The sharpest frame of each cluster is kept, and kept frames stay
+    in their original order. Frames that cannot be decoded are always kept.
+
+    Returns:
+        Tuple[List[PreparedImage], Optional[np.ndarray], List[int]]: The kept frames,
+            their hashes (None if any frame could not be hashed), and their
+            positions in images
+    """
+    start = time.perf_counter()
+    signatures = []
+    for image in images:
+        try:
+            signatures.append(frame_signature(image))
+        except Exception as e:
+            print(f"Could not hash frame, keeping it: {e}")
+            signatures.append(None)
+
+    hashed = [i for i, signature in enumerate(signatures) if signature is not None]
+    if not hashed:
+        return list(images), None, list(range(len(images)))
+
+    hashes = np.stack([signatures[i][0] for i in hashed])
+    max_distance = int((1 - threshold) * hashes.shape[1])
+    distances = hash_distances(hashes, hashes)
+
+    leaders: List[int] = []
+    clusters: List[List[int]] = []
+    for row in range(len(hashed)):
+        for leader, members in zip(leaders, clusters):
+            if distances[row, leader] <= max_distance:
+                members.append(row)
+                break
+        else:
+            leaders.append(row)
+            clusters.append([row])
+
+    kept_rows = sorted(max(members, key=lambda row: signatures[hashed[row]][1]) for members in clusters)
+    kept = sorted([hashed[row] for row in kept_rows] + [i for i, signature in enumerate(signatures) if signature is None])
+
+    print(f"Frame dedupe kept {len(kept)}/{len(images)} frames "
+          f"in {time.perf_counter() - start:.2f}s")
+    complete = len(hashed) == len(images)
+    return [images[i] for i in kept], hashes[kept_rows] if complete else None, kept
+
+
+class FrameSetAnalysisCache:
+    """
+    Analyses keyed by the perceptual hashes of the frames they were made from.
+
+    A new burst of frames rarely matches an earlier one byte for byte, so the
+    exact-match LLM response cache misses. Here a frame set matches when it was
+    seen in the same scope (room and surgery), has the same number of frames,
+    and every frame is within the reuse threshold of a frame in the cached set,
+    and vice versa. Entries live in memory with an LRU bound and a TTL.
+    """
+
+    def __init__(self, max_entries: int = ANALYSIS_CACHE_ENTRIES, ttl: float = ANALYSIS_CACHE_TTL_SECONDS,
+                 threshold: float = REUSE_SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def _matches(self, hashes: np.ndarray, cached: np.ndarray) -> bool:
+        if hashes.shape != cached.shape:
+            return False
+        max_distance = int((1 - self.threshold) * hashes.shape[1])
+        close = hash_distances(hashes, cached) <= max_distance
+        return bool(close.any(axis=1).all() and close.any(axis=0).all())
+
+    def get(self, scope: Tuple, hashes: np.ndarray) -> Optional[str]:
+        """Return the analysis of a matching frame set seen in the same scope."""
+        now = time.time()
+        with self._lock:
+            for entry_id, (cached_scope, cached, analysis, created) in list(self._entries.items()):
+                if now - created > self.ttl:
+                    del self._entries[entry_id]
+                elif cached_scope == scope and self._matches(hashes, cached):
+                    self._entries.move_to_end(entry_id)
+                    self.stats['hits'] += 1
+                    return analysis
+            self.stats['misses'] += 1
+            return None
+
+    def set(self, scope: Tuple, hashes: np.ndarray, analysis: str):
+        with self._lock:
+            self._entries[self._next_id] = (scope, hashes, analysis, time.time())
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries))
+
+
+_analysis_cache = FrameSetAnalysisCache()
+
+
+def get_frame_set_cache() -> FrameSetAnalysisCache:
+    """Return the process-wide frame set analysis cache."""
+    return _analysis_cache
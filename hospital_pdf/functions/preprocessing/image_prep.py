@@ -0,0 +1,159 @@
+import os
+import io
+import time
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List
+
+from PIL import Image, ImageOps
+
+# Longest side sent to the vision model; larger frames only add tokens
+MAX_EDGE = int(os.getenv('IMAGE_MAX_EDGE', '1568'))
+# 'JPEG' or 'WEBP'
+OUTPUT_FORMAT = os.getenv('IMAGE_FORMAT', 'JPEG').upper()
+QUALITY = int(os.getenv('IMAGE_QUALITY', '85'))
+PREP_WORKERS = 4
+
+MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp', 'PNG': 'image/png', 'GIF': 'image/gif'}
+
+_executor = ThreadPoolExecutor(max_workers=PREP_WORKERS, thread_name_prefix='image-prep')
+
+
+class PreparedImage:
+    """An image ready to send to a vision model, with its size before preprocessing."""
+
+    def __init__(self, data: bytes, mime_type: str, original_size: int, width: int = None, height: int = None):
+        self.data = data
+        self.mime_type = mime_type
+        self.original_size = original_size
+        self.width = width
+        self.height = height
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    @property
+    def base64(self) -> str:
+        return base64.b64encode(self.data).decode('ascii')
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.base64}"
+
+
+def _source_size(source) -> int:
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    return source.seek(0, io.SEEK_END)
+
+
+def _open_source(source):
+    """Something Image.open accepts, without copying file contents into memory."""
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    if isinstance(source, (str, os.PathLike)):
+        return source
+    source.seek(0)
+    return source
+
+
+def _read_source(source) -> bytes:
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return f.read()
+    source.seek(0)
+    return source.read()
+
+
+def _sniff_mime_type(data: bytes) -> str:
+    """MIME type from the file signature, for images Pillow could not decode."""
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if data.startswith(b'\x89PNG'):
+        return 'image/png'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data.startswith(b'GIF8'):
+        return 'image/gif'
+    return 'application/octet-stream'
+
+
+def prepare_image(source, max_edge: int = MAX_EDGE, output_format: str = OUTPUT_FORMAT,
+                  quality: int = QUALITY) -> PreparedImage:
+    """
+    Downscale and re-encode an image for a vision model.
+
+    The image is rotated according to its EXIF orientation, shrunk so its
+    longest side is at most max_edge, and saved as JPEG or WebP without EXIF,
+    ICC or other metadata. Images Pillow cannot decode are passed through
+    unchanged with their MIME type sniffed from the file signature.
+
+    Args:
+        source: Image bytes, a path, or a seekable binary file object
+        max_edge (int): Maximum width/height in pixels
+        output_format (str): 'JPEG' or 'WEBP'
+        quality (int): Encoder quality (1-100)
+
+    Returns:
+        PreparedImage: The encoded image and its MIME type
+    """
+    original_size = _source_size(source)
+
+    try:
+        with Image.open(_open_source(source)) as image:
+            # Let the JPEG decoder downscale by a power of two while decoding
+            image.draft('RGB', (max_edge, max_edge))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+            if image.mode not in ('RGB', 'L'):
+                # Flatten transparency onto white; neither JPEG nor the model needs alpha
+                rgba = image.convert('RGBA')
+                image = Image.new('RGB', rgba.size, (255, 255, 255))
+                image.paste(rgba, mask=rgba.getchannel('A'))
+
+            output = io.BytesIO()
+            save_args = {'quality': quality}
+            if output_format == 'JPEG':
+                save_args.update(optimize=True, progressive=True)
+            else:
+                save_args.update(method=4)
+            image.save(output, format=output_format, **save_args)
+            return PreparedImage(output.getvalue(), MIME_TYPES[output_format], original_size, *image.size)
+
+    except Exception as e:
+        print(f"Could not preprocess image, sending it unchanged: {e}")
+        raw = _read_source(source)
+        return PreparedImage(raw, _sniff_mime_type(raw), original_size)
+
+
+def prepare_images(sources: Iterable, max_edge: int = MAX_EDGE, output_format: str = OUTPUT_FORMAT,
+                   quality: int = QUALITY) -> List[PreparedImage]:
+    """Preprocess several images concurrently, preserving their order."""
+    start = time.perf_counter()
+    images = list(_executor.map(
+        lambda source: prepare_image(source, max_edge, output_format, quality), sources
+    ))
+
+    stats = image_prep_stats(images)
+    print(f"Preprocessed {stats['images']} images in {time.perf_counter() - start:.2f}s: "
+          f"{stats['bytes_in'] / 1024:.0f} KB -> {stats['bytes_out'] / 1024:.0f} KB "
+          f"({stats['bytes_saved'] / 1024:.0f} KB saved)")
+    return images
+
+
+def image_prep_stats(images: List[PreparedImage]) -> Dict[str, int]:
+    """Byte totals before and after preprocessing."""
+    bytes_in = sum(image.original_size for image in images)
+    bytes_out = sum(image.size for image in images)
+    return {
+        'images': len(images),
+        'bytes_in': bytes_in,
+        'bytes_out': bytes_out,
+        'bytes_saved': bytes_in - bytes_out
+    }
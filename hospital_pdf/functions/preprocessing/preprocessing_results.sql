@@ -0,0 +1,45 @@
+-- Room/surgery-scoped, append-only store for pre-surgery analysis results.
+-- Apply once in the Supabase SQL editor; update_supabase and the report readers
+-- in this package rely on the columns, index, view and function below.
+
+alter table preprocessing
+    add column if not exists room_id text not null default 'default',
+    add column if not exists surgery_id text,
+    add column if not exists analysis_key text,
+    add column if not exists created_at timestamptz not null default now();
+
+-- Upsert target: repeating a result for a room updates its row (and created_at)
+-- instead of adding another
+create unique index if not exists preprocessing_room_analysis_key
+    on preprocessing (room_id, analysis_key);
+
+-- Latest-per-room lookups and compaction walk this index newest first
+create index if not exists preprocessing_room_latest
+    on preprocessing (room_id, created_at desc, id desc);
+
+create index if not exists preprocessing_surgery
+    on preprocessing (surgery_id, id desc);
+
+create or replace view preprocessing_latest as
+    select distinct on (room_id) *
+    from preprocessing
+    order by room_id, created_at desc, id desc;
+
+-- Deletes all but the newest keep_per_room rows of each room; returns rows removed
+create or replace function compact_preprocessing(keep_per_room integer default 20)
+returns integer
+language plpgsql
+as $$
+declare
+    removed integer;
+begin
+    delete from preprocessing p
+    using (
+        select id, row_number() over (partition by room_id order by created_at desc, id desc) as rank
+        from preprocessing
+    ) ranked
+    where p.id = ranked.id and ranked.rank > keep_per_room;
+    get diagnostics removed = row_count;
+    return removed;
+end;
+$$;
@@ -4,6 +4,7 @@ from dotenv import load_dotenv
 from typing import List, Dict
 from .supabase_functions.supabaseFunctions import upload_requirements, get_requirements_by_phase, get_all_requirements
 from pathlib import Path
+from .llm_cache import cached_completion
 
 # Get the project root directory (2 levels up from this file)
 ROOT_DIR = Path(__file__).parent.parent.parent
@@ -43,12 +44,13 @@ Remember:
 - Include safety checks where appropriate
 - Maintain medical terminology accuracy"""
 
-def extract_procedure_steps(procedure_text: str) -> List[Dict[str, str]]:
+def extract_procedure_steps(procedure_text: str, bypass_cache: bool = False) -> List[Dict[str, str]]:
     """
     Extract ordered steps by phase from a surgical procedure description using GPT-4.
     
     Args:
         procedure_text (str): The surgical procedure description
+        bypass_cache (bool, optional): Always call the model instead of reusing a cached answer
         
     Returns:
         List[Dict[str, str]]: List of steps with their descriptions and phases
@@ -56,7 +58,9 @@ def extract_procedure_steps(procedure_text: str) -> List[Dict[str, str]]:
     try:
         print("Extracting procedure steps...")
         
-        completion = client.chat.completions.create(
+        response_text = cached_completion(
+            client,
+            bypass_cache=bypass_cache,
             model="gpt-4o",
             temperature=0.1,  # Low temperature for consistent, precise responses
             messages=[
@@ -72,7 +76,6 @@ def extract_procedure_steps(procedure_text: str) -> List[Dict[str, str]]:
         )
         
         # Parse the response into ordered steps by phase
-        response_text = completion.choices[0].message.content
         steps = []
         current_phase = None
         
@@ -1,6 +1,9 @@
-from .supabaseFunctions import initialize_supabase
+from .client_pool import get_supabase_client
+from .requirement_catalog import get_requirement_catalog
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional
 import logging
+import os
 
 # Set up logging
 logging.basicConfig(
@@ -9,60 +12,83 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-def update_requirement_status(requirement: str) -> bool:
+# Verbose before/after auditing is opt-in and runs on this worker, off the request path
+AUDIT_ENABLED = os.getenv('CHECKLIST_AUDIT', '').lower() in ('1', 'true', 'yes')
+_audit_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='checklist-audit')
+
+def _audit_requirement_update(requirement: str, updated_rows: List[Dict]):
+    """Log the before/after state of an updated requirement."""
+    try:
+        for row in updated_rows:
+            # The completion_status guard on the update means the row was incomplete before
+            logging.info(f"Requirement state before update: {dict(row, completion_status=False)}")
+        
+        supabase = get_supabase_client()
+        current_state = supabase.table('treehacks_reqs') \
+            .select('*') \
+            .eq("requirement", requirement) \
+            .execute()
+        
+        for row in current_state.data:
+            logging.info(f"Updated requirement state: {row}")
+            
+    except Exception as e:
+        logging.error(f"Error auditing requirement update: {str(e)}")
+
+def update_requirement_status(requirement: str, audit: Optional[bool] = None) -> bool:
     """
     Update the completion status of a specific requirement from False to True.
     
+    The update is a single guarded round trip (UPDATE ... WHERE completion_status = false
+    RETURNING *), so repeating it for an already completed requirement is a no-op.
+    
     Args:
         requirement (str): The requirement text to search for
+        audit (bool, optional): Log the before/after state in the background.
+            Defaults to the CHECKLIST_AUDIT environment variable.
         
     Returns:
-        bool: True if update was successful, False otherwise
+        bool: True if the requirement exists and is now completed, False otherwise
     """
+    if audit is None:
+        audit = AUDIT_ENABLED
+        
     try:
         logging.info(f"Starting update process for requirement: {requirement[:100]}...")
-        print(f"Starting update process for requirement: {requirement[:100]}...")
-        
-        # Initialize Supabase client
-        logging.info("Initializing Supabase client...")
-        supabase = initialize_supabase()
-        
-        # Log the current state before update
-        current_state = supabase.table('treehacks_reqs') \
-            .select('*') \
-            .eq("requirement", requirement) \
-            .execute()
-        
-        if current_state.data:
-            logging.info(f"Current requirement state: {current_state.data[0]}")
-            print(f"Found existing requirement with ID: {current_state.data[0].get('id')}")
-        else:
-            logging.warning(f"No existing requirement found matching: {requirement[:100]}")
-            print(f"Warning: No existing requirement found matching: {requirement[:100]}")
+        supabase = get_supabase_client()
         
-        # Update the requirement's completion status
-        logging.info("Attempting to update completion status...")
+        # PostgREST returns the updated rows, so no follow-up SELECT is needed
         result = supabase.table('treehacks_reqs') \
             .update({"completion_status": True}) \
             .eq("requirement", requirement) \
+            .eq("completion_status", False) \
             .execute()
             
-        # Check if update was successful
         if result.data:
             success_msg = f"Successfully updated status for: {requirement[:100]}"
             logging.info(success_msg)
             print(success_msg)
+            get_requirement_catalog().mark_completed([requirement])
             
-            # Log the updated state
-            updated_state = supabase.table('treehacks_reqs') \
-                .select('*') \
-                .eq("requirement", requirement) \
-                .execute()
+            if audit:
+                _audit_executor.submit(_audit_requirement_update, requirement, result.data)
+            
+            return True
+        
+        # Nothing changed: the requirement is either already completed or missing.
+        # A fresh catalog entry answers that without another round trip.
+        if get_requirement_catalog().is_completed(requirement, load=False):
+            logging.info(f"Requirement already completed: {requirement[:100]}")
+            return True
             
-            if updated_state.data:
-                logging.info(f"Updated requirement state: {updated_state.data[0]}")
-                print(f"Updated requirement state - completion_status: {updated_state.data[0].get('completion_status')}")
+        existing = supabase.table('treehacks_reqs') \
+            .select('id') \
+            .eq("requirement", requirement) \
+            .limit(1) \
+            .execute()
             
+        if existing.data:
+            logging.info(f"Requirement already completed: {requirement[:100]}")
             return True
         else:
             error_msg = f"No matching requirement found for: {requirement[:100]}"
@@ -82,10 +108,59 @@ def update_requirement_status(requirement: str) -> bool:
             
         return False
 
+def update_requirement_statuses(requirements: List[str], audit: Optional[bool] = None) -> List[str]:
+    """
+    Complete several requirements with a single bulk update.
+    
+    Args:
+        requirements (List[str]): The requirement texts to mark as completed
+        audit (bool, optional): Log the before/after state in the background.
+            Defaults to the CHECKLIST_AUDIT environment variable.
+        
+    Returns:
+        List[str]: The requirements changed by this call. Requirements that were already
+            completed (or don't exist) are left out. None if the update failed.
+    """
+    if audit is None:
+        audit = AUDIT_ENABLED
+        
+    # Deduplicate while keeping the caller's order
+    requirements = list(dict.fromkeys(requirements))
+    if not requirements:
+        return []
+        
+    try:
+        logging.info(f"Starting bulk update for {len(requirements)} requirements")
+        supabase = get_supabase_client()
+        
+        result = supabase.table('treehacks_reqs') \
+            .update({"completion_status": True}) \
+            .in_("requirement", requirements) \
+            .eq("completion_status", False) \
+            .execute()
+            
+        updated = {row['requirement'] for row in result.data}
+        get_requirement_catalog().mark_completed(updated)
+        print(f"Bulk update completed {len(updated)}/{len(requirements)} requirements")
+        logging.info(f"Bulk update completed {len(updated)}/{len(requirements)} requirements")
+        
+        if audit:
+            for requirement in updated:
+                rows = [row for row in result.data if row['requirement'] == requirement]
+                _audit_executor.submit(_audit_requirement_update, requirement, rows)
+        
+        return [req for req in requirements if req in updated]
+        
+    except Exception as e:
+        error_msg = f"Error bulk updating requirement statuses: {str(e)}"
+        logging.error(error_msg)
+        print(error_msg)
+        return None
+
 if __name__ == "__main__":
     # Test the function with a sample requirement
     test_requirement = "Confirm patient's identity."
     print("\nTesting update_requirement_status function:")
     print("-" * 50)
-    success = update_requirement_status(test_requirement)
+    success = update_requirement_status(test_requirement, audit=True)
     print(f"\nUpdate {'successful' if success else 'failed'}")
@@ -0,0 +1,215 @@
+import os
+import time
+import logging
+import threading
+from typing import Dict, Tuple
+
+import httpx
+from dotenv import load_dotenv
+# httpx_client injection needs supabase-py 2.16+ (pinned in requirements.txt)
+from supabase import create_client, Client, ClientOptions
+
+# Connections idle for longer than this are probed before the client is reused
+HEALTH_CHECK_IDLE_SECONDS = 60.0
+HEALTH_CHECK_TIMEOUT = 5.0
+
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE_CONNECTIONS = 10
+KEEPALIVE_EXPIRY = 120.0
+
+
+def _build_http_client(on_request=None) -> httpx.Client:
+    """Build the keep-alive HTTP client shared by every pooled Supabase client."""
+    limits = httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY
+    )
+    event_hooks = {'request': [on_request]} if on_request else None
+    try:
+        return httpx.Client(http2=True, limits=limits, event_hooks=event_hooks)
+    except ImportError:
+        # HTTP/2 needs the optional 'h2' package; keep-alive still works over HTTP/1.1
+        logging.warning("h2 not installed, Supabase pool falling back to HTTP/1.1")
+        return httpx.Client(limits=limits, event_hooks=event_hooks)
+
+
+class SupabaseClientPool:
+    """
+    Registry of lazily built Supabase clients.
+
+    Each thread gets its own client per credential pair (the client object keeps
+    per-request builder state), while all of them share one keep-alive httpx
+    connection pool so the TLS handshake is only paid once per connection.
+    Clients that sat idle are health-checked before reuse and rebuilt, together
+    with the shared connection pool, when the check fails.
+
+    Every HTTP request through the shared pool is counted, and so is every TCP
+    connection it opens (via httpcore's trace extension), so the stats show how
+    many requests rode an already open connection.
+    """
+
+    def __init__(self, health_check_idle_seconds: float = HEALTH_CHECK_IDLE_SECONDS):
+        self.health_check_idle_seconds = health_check_idle_seconds
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._env_loaded = False
+        self._http_clients: Dict[Tuple[str, str], httpx.Client] = {}
+        self._generations: Dict[Tuple[str, str], int] = {}
+        self._last_used: Dict[Tuple[str, str], float] = {}
+        self._stats = {
+            'clients_created': 0,
+            'clients_reused': 0,
+            'http_requests': 0,
+            'connections_opened': 0,
+            'reconnects': 0,
+            'health_checks': 0
+        }
+
+    def _credentials(self, key_env: str) -> Tuple[str, str]:
+        if not self._env_loaded:
+            load_dotenv()
+            self._env_loaded = True
+        supabase_url = os.getenv('SUPABASE_URL')
+        supabase_key = os.getenv(key_env)
+
+        if not supabase_url or not supabase_key:
+            raise ValueError("Missing Supabase credentials in .env file")
+
+        return supabase_url, supabase_key
+
+    def _on_request(self, request: httpx.Request):
+        with self._lock:
+            self._stats['http_requests'] += 1
+        request.extensions['trace'] = self._on_trace
+
+    def _on_trace(self, event_name: str, info: Dict):
+        # Emitted once per new connection; requests on a kept-alive connection skip it
+        if event_name == 'connection.connect_tcp.complete':
+            with self._lock:
+                self._stats['connections_opened'] += 1
+
+    def _build_client(self, url: str, key: str, http_client: httpx.Client) -> Client:
+        # No fallback: a client that silently opened its own connections would
+        # make the shared pool, its health checks and its stats meaningless
+        return create_client(url, key, options=ClientOptions(httpx_client=http_client))
+
+    def _is_healthy(self, url: str, key: str, http_client: httpx.Client) -> bool:
+        if http_client.is_closed:
+            return False
+        try:
+            response = http_client.get(
+                f"{url}/rest/v1/",
+                headers={'apikey': key, 'Authorization': f"Bearer {key}"},
+                timeout=HEALTH_CHECK_TIMEOUT
+            )
+            return response.status_code < 500
+        except httpx.HTTPError as e:
+            logging.warning(f"Supabase health check failed: {e}")
+            return False
+
+    def _reconnect(self, pool_key: Tuple[str, str]):
+        """Drop the shared connection pool so every thread rebuilds its client."""
+        old_client = self._http_clients.pop(pool_key, None)
+        if old_client is not None:
+            old_client.close()
+        self._generations[pool_key] = self._generations.get(pool_key, 0) + 1
+        self._stats['reconnects'] += 1
+
+    def get_client(self, key_env: str = 'SUPABASE_SERVICE_KEY') -> Client:
+        """
+        Return the calling thread's pooled client for the given credentials.
+
+        Args:
+            key_env (str): Name of the environment variable holding the API key
+
+        Returns:
+            Client: A Supabase client backed by the shared connection pool
+        """
+        url, key = self._credentials(key_env)
+        pool_key = (url, key)
+        now = time.monotonic()
+
+        with self._lock:
+            last_used = self._last_used.get(pool_key)
+            http_client = self._http_clients.get(pool_key)
+            needs_check = (
+                http_client is not None
+                and last_used is not None
+                and now - last_used > self.health_check_idle_seconds
+            )
+            # Claim the check so concurrent threads don't all probe at once
+            self._last_used[pool_key] = now
+
+        if needs_check:
+            healthy = self._is_healthy(url, key, http_client)
+            with self._lock:
+                self._stats['health_checks'] += 1
+                if not healthy and self._http_clients.get(pool_key) is http_client:
+                    self._reconnect(pool_key)
+
+        clients = getattr(self._local, 'clients', None)
+        if clients is None:
+            clients = self._local.clients = {}
+
+        with self._lock:
+            generation = self._generations.get(pool_key, 0)
+            cached = clients.get(pool_key)
+            if cached is not None and cached[1] == generation:
+                self._stats['clients_reused'] += 1
+                return cached[0]
+
+            http_client = self._http_clients.get(pool_key)
+            if http_client is None:
+                http_client = self._http_clients[pool_key] = _build_http_client(self._on_request)
+            self._stats['clients_created'] += 1
+
+        client = self._build_client(url, key, http_client)
+        clients[pool_key] = (client, generation)
+        return client
+
+    def stats(self) -> Dict[str, int]:
+        """Return a snapshot of the pool's counters and open shared HTTP clients."""
+        with self._lock:
+            return dict(
+                self._stats,
+                connections_reused=max(0, self._stats['http_requests'] - self._stats['connections_opened']),
+                shared_http_clients=len(self._http_clients)
+            )
+
+    def reset(self):
+        """Close all pooled connections; clients are rebuilt on next use."""
+        with self._lock:
+            for pool_key in list(self._http_clients):
+                self._reconnect(pool_key)
+
+
+_pool = SupabaseClientPool()
+
+
+def get_supabase_client(key_env: str = 'SUPABASE_SERVICE_KEY') -> Client:
+    """Return a pooled Supabase client for the calling thread."""
+    return _pool.get_client(key_env)
+
+
+def get_pool_stats() -> Dict[str, int]:
+    """
+    Return counters for the process-wide pool.
+
+    clients_created/clients_reused count per-thread Client objects. Flask runs
+    each request on a new thread, so these say little about connection reuse:
+    every client sends its requests through one of the shared_http_clients (one
+    per credential pair). http_requests, connections_opened and
+    connections_reused (requests sent over an already open connection) measure
+    that directly.
+
+    Returns:
+        Dict[str, int]: Client, request and connection counters, reconnects,
+            health checks and open shared HTTP clients
+    """
+    return _pool.stats()
+
+
+def reset_supabase_clients():
+    """Close the shared connections, forcing every thread to reconnect."""
+    _pool.reset()
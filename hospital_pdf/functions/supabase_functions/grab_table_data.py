@@ -1,21 +1,15 @@
-import os
-from dotenv import load_dotenv
-from supabase import create_client, Client
+from supabase import Client
+from .client_pool import get_supabase_client
 
 def initialize_supabase() -> Client:
-    """Initialize and return the Supabase client."""
-    load_dotenv()
-    supabase_url = os.getenv('SUPABASE_URL')
-    supabase_key = os.getenv('SUPABASE_SERVICE_KEY')
-    if not supabase_url or not supabase_key:
-        raise ValueError("Missing Supabase credentials in .env file")
-    return create_client(supabase_url, supabase_key)
+    """Return the calling thread's pooled Supabase client."""
+    return get_supabase_client()
 
 def get_all_requirements():
     """
     Test function for the batch compliance checking system using real requirements from Supabase
     """
-    supabase = initialize_supabase()
+    supabase = get_supabase_client()
     result = supabase.table('treehacks_reqs') \
         .select('requirement') \
         .order('phase,order') \
@@ -5,7 +5,8 @@ from typing import List, Dict
 from supabase import create_client, Client
 from pathlib import Path
 from functions.supabase.supabaseFunctions import upload_requirements, get_requirements_by_phase, get_all_requirements
-import base64
+from functions.llm_cache import cached_completion
+from functions.preprocessing.image_prep import prepare_image
 from PIL import Image
 import io
 from io import BytesIO
@@ -63,11 +64,14 @@ def initialize_supabase() -> Client:
         
     return create_client(supabase_url, supabase_key)
 
+# Checklists need legible small print, so they get a larger edge than scene photos
+CHECKLIST_MAX_EDGE = 2048
+
 def encode_image(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode("utf-8")
+    """Downscale and re-encode an image, returning it as a data URL with the correct MIME type."""
+    return prepare_image(image_path, max_edge=CHECKLIST_MAX_EDGE).data_url
 
-def extract_procedure_steps(image_path: str = None) -> List[Dict[str, str]]:
+def extract_procedure_steps(image_path: str = None, bypass_cache: bool = False) -> List[Dict[str, str]]:
     """Extract ordered steps by phase from a surgical checklist using GPT-4 Vision."""
     try:
         # Use the ROOT_DIR to find the image
@@ -80,10 +84,12 @@ def extract_procedure_steps(image_path: str = None) -> List[Dict[str, str]]:
             raise FileNotFoundError(f"Image not found at {image_path}")
             
         print(f"Reading image...")
-        base64_image = encode_image(str(image_path))
+        image_url = encode_image(str(image_path))
         
         print("Making GPT-4 Vision API call...")
-        completion = client.chat.completions.create(
+        response_text = cached_completion(
+            client,
+            bypass_cache=bypass_cache,
             model="gpt-4o",
             messages=[
                 {
@@ -96,7 +102,7 @@ def extract_procedure_steps(image_path: str = None) -> List[Dict[str, str]]:
                         {"type": "text", "text": "Extract the ordered steps by phase from this surgical checklist."},
                         {
                             "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
+                            "image_url": {"url": image_url}
                         }
                     ]
                 }
@@ -105,7 +111,6 @@ def extract_procedure_steps(image_path: str = None) -> List[Dict[str, str]]:
         )
         
         print("Received GPT response, parsing steps...")
-        response_text = completion.choices[0].message.content
         print(f"Raw response:\n{response_text[:200]}...")  # Print first 200 chars
         
         # Parse the response into ordered steps by phase
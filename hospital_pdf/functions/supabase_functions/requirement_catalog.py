@@ -0,0 +1,237 @@
+import os
+import time
+import logging
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+
+from .client_pool import get_supabase_client
+
+# How long a loaded catalog is trusted before the table is read again
+CATALOG_TTL_SECONDS = float(os.getenv('REQUIREMENT_CATALOG_TTL', '300'))
+
+CATALOG_COLUMNS = 'id,requirement,instructions,phase,order,completion_status'
+
+
+class LocalChangeFeed:
+    """
+    In-process stand-in for a Supabase realtime channel on treehacks_reqs.
+
+    Payloads follow the realtime postgres_changes shape:
+    {'eventType': 'INSERT' | 'UPDATE' | 'DELETE', 'new': {...}, 'old': {...}}
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: List[Callable[[Dict], None]] = []
+
+    def subscribe(self, callback: Callable[[Dict], None]) -> Callable[[], None]:
+        """Register a callback and return a function that unsubscribes it."""
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+
+        return unsubscribe
+
+    def publish(self, event_type: str, new: Dict = None, old: Dict = None):
+        """Deliver a change event to every subscriber."""
+        payload = {'eventType': event_type, 'new': new or {}, 'old': old or {}}
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback(payload)
+
+
+class RequirementCatalog:
+    """
+    Cached, ordered view of the treehacks_reqs table.
+
+    Holds the ordered requirement list, id/text/phase indexes and a completion
+    bitmap. The table is only re-read when the TTL expires or the catalog is
+    invalidated; completion updates are applied in place.
+    """
+
+    def __init__(self, ttl: float = CATALOG_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._loaded_at: Optional[float] = None
+        self._rows: List[Dict] = []
+        self._by_id: Dict[int, int] = {}
+        self._by_text: Dict[str, int] = {}
+        self._by_phase: Dict[str, List[int]] = {}
+        self._phases: List[str] = []
+        self._completed = bytearray()
+        self._unsubscribe = None
+        self.stats = {'loads': 0, 'hits': 0, 'invalidations': 0, 'change_events': 0}
+
+    def _load(self):
+        print("Loading requirement catalog from Supabase...")
+        supabase = get_supabase_client()
+        result = supabase.table('treehacks_reqs') \
+            .select(CATALOG_COLUMNS) \
+            .order('phase,order') \
+            .execute()
+        self._index(result.data or [])
+        self._loaded_at = time.monotonic()
+        self.stats['loads'] += 1
+
+    def _index(self, rows: List[Dict]):
+        self._rows = [dict(row) for row in rows]
+        self._by_id = {}
+        self._by_text = {}
+        self._by_phase = {}
+        self._completed = bytearray(len(self._rows))
+
+        for position, row in enumerate(self._rows):
+            self._by_id[row.get('id')] = position
+            self._by_text.setdefault(row['requirement'], position)
+            self._by_phase.setdefault(row.get('phase'), []).append(position)
+            self._completed[position] = 1 if row.get('completion_status') else 0
+
+        # Phases in procedure order: rows are inserted in checklist order, so the
+        # phase whose first requirement has the lowest id comes first
+        self._phases = sorted(
+            self._by_phase,
+            key=lambda phase: min(self._rows[p].get('id') or 0 for p in self._by_phase[phase])
+        )
+
+    def _is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def _ensure_fresh(self):
+        with self._lock:
+            if self._is_fresh():
+                self.stats['hits'] += 1
+            else:
+                self._load()
+
+    def invalidate(self):
+        """Drop the cached table so the next read reloads it."""
+        with self._lock:
+            self._loaded_at = None
+            self.stats['invalidations'] += 1
+
+    def requirements(self) -> List[Dict]:
+        """Return all requirement rows in phase/order order."""
+        self._ensure_fresh()
+        with self._lock:
+            return [dict(row, completion_status=bool(self._completed[i])) for i, row in enumerate(self._rows)]
+
+    def requirement_texts(self) -> List[str]:
+        """Return all requirement texts in phase/order order."""
+        self._ensure_fresh()
+        with self._lock:
+            return [row['requirement'] for row in self._rows]
+
+    def phases(self) -> List[str]:
+        """Return the phases in procedure order."""
+        self._ensure_fresh()
+        with self._lock:
+            return list(self._phases)
+
+    def get_by_id(self, requirement_id: int) -> Optional[Dict]:
+        """Return the requirement row with the given id, if any."""
+        self._ensure_fresh()
+        with self._lock:
+            position = self._by_id.get(requirement_id)
+            if position is None:
+                return None
+            return dict(self._rows[position], completion_status=bool(self._completed[position]))
+
+    def get_phase(self, phase: str, open_only: bool = False) -> List[Dict]:
+        """Return the requirement rows of a phase in order."""
+        self._ensure_fresh()
+        with self._lock:
+            return [
+                dict(self._rows[p], completion_status=bool(self._completed[p]))
+                for p in self._by_phase.get(phase, [])
+                if not (open_only and self._completed[p])
+            ]
+
+    def is_completed(self, requirement: str, load: bool = True) -> Optional[bool]:
+        """
+        Return the cached completion status of a requirement.
+
+        Args:
+            requirement (str): The requirement text
+            load (bool): Reload the table if the cache is stale. When False, a stale
+                or empty cache answers None instead of reading the table.
+
+        Returns:
+            Optional[bool]: The completion status, or None if the requirement is unknown
+        """
+        if load:
+            self._ensure_fresh()
+        with self._lock:
+            if not load and not self._is_fresh():
+                return None
+            position = self._by_text.get(requirement)
+            if position is None:
+                return None
+            return bool(self._completed[position])
+
+    def mark_completed(self, requirements: Iterable[str]):
+        """Record completions made through this process without reloading the table."""
+        with self._lock:
+            for requirement in requirements:
+                position = self._by_text.get(requirement)
+                if position is not None:
+                    self._completed[position] = 1
+
+    def apply_change(self, payload: Dict):
+        """
+        Apply a realtime-style change event to the cached table.
+
+        Completion updates are applied in place; anything that can change the
+        ordering (inserts, deletes, phase or order edits) invalidates the cache.
+        """
+        with self._lock:
+            self.stats['change_events'] += 1
+            new = payload.get('new') or {}
+            position = self._by_id.get(new.get('id'))
+
+            if payload.get('eventType') != 'UPDATE' or position is None:
+                self.invalidate()
+                return
+
+            row = self._rows[position]
+            if any(new.get(key, row.get(key)) != row.get(key) for key in ('requirement', 'phase', 'order')):
+                self.invalidate()
+                return
+
+            row.update({key: value for key, value in new.items() if key in row})
+            self._completed[position] = 1 if new.get('completion_status', row.get('completion_status')) else 0
+
+    def attach_change_feed(self, feed):
+        """
+        Keep the catalog in sync with a change feed.
+
+        Args:
+            feed: Any object with subscribe(callback) returning an unsubscribe function,
+                such as a Supabase realtime channel wrapper or LocalChangeFeed
+        """
+        self.detach_change_feed()
+        self._unsubscribe = feed.subscribe(self.apply_change)
+
+    def detach_change_feed(self):
+        """Stop listening to the attached change feed, if any."""
+        if self._unsubscribe is not None:
+            self._unsubscribe()
+            self._unsubscribe = None
+
+
+_catalog = RequirementCatalog()
+
+
+def get_requirement_catalog() -> RequirementCatalog:
+    """Return the process-wide requirement catalog."""
+    return _catalog
+
+
+def invalidate_requirement_catalog():
+    """Force the next catalog read to reload treehacks_reqs."""
+    logging.info("Invalidating requirement catalog")
+    _catalog.invalidate()
@@ -1,10 +1,10 @@
-import os
 from pathlib import Path
 import json
 import logging
-from supabase import create_client, Client
-from dotenv import load_dotenv
+from supabase import Client
 from typing import List, Dict, Optional
+from .client_pool import get_supabase_client
+from .requirement_catalog import invalidate_requirement_catalog
 
 # Set up logging
 logging.basicConfig(
@@ -14,15 +14,8 @@ logging.basicConfig(
 )
 
 def initialize_supabase() -> Client:
-    """Initialize and return the Supabase client."""
-    load_dotenv()
-    supabase_url = os.getenv('SUPABASE_URL')
-    supabase_key = os.getenv('SUPABASE_SERVICE_KEY')
-
-    if not supabase_url or not supabase_key:
-        raise ValueError("Missing Supabase credentials in .env file")
-
-    return create_client(supabase_url, supabase_key)
+    """Return the calling thread's pooled Supabase client."""
+    return get_supabase_client()
 
 def get_existing_files(supabase: Client, bucket_name: str = 'maps') -> set:
     """Retrieve a set of existing file names from Supabase storage."""
@@ -48,7 +41,7 @@ def upload_requirement(requirement: str, phase: str, order: int) -> Dict:
         Dict: The created requirement record
     """
     try:
-        supabase = initialize_supabase()
+        supabase = get_supabase_client()
         
         response = supabase.table('treehacks_reqs').insert({
             'requirement': requirement,
@@ -56,6 +49,7 @@ def upload_requirement(requirement: str, phase: str, order: int) -> Dict:
             'order': order
         }).execute()
         
+        invalidate_requirement_catalog()
         return response.data[0]
         
     except Exception as e:
@@ -73,7 +67,7 @@ def upload_requirements(requirements: List[Dict[str, str]]) -> List[Dict]:
         List[Dict]: List of created requirement records
     """
     try:
-        supabase = initialize_supabase()
+        supabase = get_supabase_client()
         
         # Prepare records for batch insert
         records = [
@@ -86,6 +80,7 @@ def upload_requirements(requirements: List[Dict[str, str]]) -> List[Dict]:
         ]
         
         response = supabase.table('treehacks_reqs').insert(records).execute()
+        invalidate_requirement_catalog()
         return response.data
         
     except Exception as e:
@@ -95,7 +90,7 @@ def upload_requirements(requirements: List[Dict[str, str]]) -> List[Dict]:
 def get_all_requirements() -> List[Dict]:
     """Retrieve all requirements from the treehacks_reqs table."""
     try:
-        supabase = initialize_supabase()
+        supabase = get_supabase_client()
         
         response = supabase.table('treehacks_reqs')\
             .select('*')\
@@ -119,7 +114,7 @@ def get_requirements_by_phase(phase: str) -> List[Dict]:
         List[Dict]: List of requirement records for the specified phase
     """
     try:
-        supabase = initialize_supabase()
+        supabase = get_supabase_client()
         
         response = supabase.table('treehacks_reqs')\
             .select('*')\
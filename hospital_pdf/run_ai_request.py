@@ -7,12 +7,17 @@ def main():
                         help='The question part of the prompt')
     parser.add_argument('--prompt-content', required=True, 
                         help='The content to be analyzed')
+    parser.add_argument('--pdf', default=None,
+                        help='Optional guideline PDF to answer from')
+    parser.add_argument('--full-document', action='store_true',
+                        help='Send the whole PDF instead of the most relevant excerpts')
     
     args = parser.parse_args()
     
     # Make the request
     print("Making AI request...")
-    response = call_openai_live(args.prompt_question, args.prompt_content)
+    response = call_openai_live(args.prompt_question, args.prompt_content,
+                                pdf_path=args.pdf, full_document=args.full_document)
     
     if response:
         print("\nAI Response:")
@@ -1,24 +1,50 @@
-from hospital_pdf.functions.combinePDF import combine_pdfs
+from hospital_pdf.functions.combinePDF import merge_pdfs
+from hospital_pdf.functions.batch_combine import read_manifest, run_batch
 import argparse
 
+def run_manifest(manifest_path, workers=None, force=False):
+    """Run every merge job in a manifest and print a throughput summary."""
+    jobs = read_manifest(manifest_path)
+    print(f"Running {len(jobs)} merge jobs from {manifest_path}...")
+    
+    summary = run_batch(jobs, workers=workers, force=force)
+    
+    print("-" * 50)
+    print(f"Merged: {summary['merged']}  Skipped: {summary['skipped']}  Failed: {summary['failed']}")
+    print(f"Total time: {summary['seconds']:.2f}s "
+          f"({summary['jobs_per_second']:.1f} jobs/s, {summary['mb_per_second']:.1f} MB/s)")
+    return summary['failed'] == 0
+
 def main():
     # Set up argument parser
-    parser = argparse.ArgumentParser(description='Combine two PDF files into one.')
-    parser.add_argument('pdf1', help='Path to the first PDF file')
-    parser.add_argument('pdf2', help='Path to the second PDF file')
-    parser.add_argument('output', help='Path for the output combined PDF')
+    parser = argparse.ArgumentParser(description='Combine PDF files into one, or run a batch manifest.')
+    parser.add_argument('paths', nargs='*',
+                        help='Paths of the PDF files to combine, in order, followed by the output path')
+    parser.add_argument('--manifest', help='JSONL or CSV manifest of merge jobs to run in parallel')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of worker processes for --manifest (default: CPU count)')
+    parser.add_argument('--force', action='store_true',
+                        help='Re-merge outputs that are already up to date')
 
     # Parse arguments
     args = parser.parse_args()
 
-    # Run the combination
-    print(f"Attempting to combine:\n1. {args.pdf1}\n2. {args.pdf2}\nOutput: {args.output}")
-    
-    success = combine_pdfs(args.pdf1, args.pdf2, args.output)
+    if args.manifest:
+        success = run_manifest(args.manifest, args.workers, args.force)
+    else:
+        if len(args.paths) < 2:
+            parser.error('at least one input PDF and an output path are required')
+        inputs, output = args.paths[:-1], args.paths[-1]
+        
+        # Run the combination
+        listing = "\n".join(f"{i}. {path}" for i, path in enumerate(inputs, start=1))
+        print(f"Attempting to combine:\n{listing}\nOutput: {output}")
+        
+        success = merge_pdfs(inputs, output)
     
     if not success:
         print("PDF combination failed. Please check the error messages above.")
         exit(1)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main() 
@@ -0,0 +1,73 @@
+from hospital_pdf.functions.after_action_report.report_template import ReportTemplate, get_report_template
+from PyPDF2 import PdfReader
+from io import BytesIO
+import argparse
+import random
+import time
+
+WORDS = (
+    "patient incision sterile field timeout verified instrument count anesthesia "
+    "hemostasis suture retractor surgeon nurse consent allergy antibiotic site marking "
+    "blood loss vitals stable closure dressing specimen laparoscopic trocar irrigation"
+).split()
+
+class PerParagraphTemplate(ReportTemplate):
+    """Rebuilds the stylesheet for every paragraph, as reports did before templates were shared."""
+
+    def section_header(self, text):
+        return ReportTemplate().section_header(text)
+
+    def content_paragraph(self, text):
+        return ReportTemplate().content_paragraph(text)
+
+def synthetic_report(sections, words_per_section=120, seed=0):
+    """Build report text of the given number of paragraphs (about 4 per page)."""
+    rng = random.Random(seed)
+    paragraphs = []
+    for i in range(sections):
+        body = " ".join(rng.choice(WORDS) for _ in range(words_per_section))
+        paragraphs.append(f"Section {i + 1}: {body}.")
+    return "\n\n".join(paragraphs)
+
+def benchmark(mode, report, reports):
+    """Render the report repeatedly in memory and return (seconds, pages)."""
+    pages = 0
+    start = time.perf_counter()
+    for _ in range(reports):
+        if mode == 'shared':
+            template = get_report_template()
+        elif mode == 'per-report':
+            template = ReportTemplate()
+        else:
+            template = PerParagraphTemplate()
+
+        output = BytesIO()
+        if not template.render(report, output):
+            raise RuntimeError(f"Report rendering failed in {mode} mode")
+        pages = len(PdfReader(BytesIO(output.getvalue())).pages)
+    return time.perf_counter() - start, pages
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark post-surgery report rendering throughput.')
+    parser.add_argument('--reports', type=int, default=5,
+                        help='Number of reports to render per mode')
+    parser.add_argument('--sections', type=int, default=385,
+                        help='Paragraphs per synthetic report (385 is about 100 pages)')
+    parser.add_argument('--modes', nargs='+', default=['shared', 'per-report', 'per-paragraph'],
+                        choices=['shared', 'per-report', 'per-paragraph'],
+                        help='Template strategies to compare')
+
+    args = parser.parse_args()
+    report = synthetic_report(args.sections)
+
+    # Warm up fonts and the shared template so the first mode isn't penalised
+    get_report_template().render(synthetic_report(5), BytesIO())
+
+    print("-" * 50)
+    for mode in args.modes:
+        seconds, pages = benchmark(mode, report, args.reports)
+        print(f"{mode:>13}: {args.reports} reports x {pages} pages in {seconds:.2f}s "
+              f"({args.reports / seconds:.2f} reports/s, {args.reports * pages / seconds:.0f} pages/s)")
+
+if __name__ == "__main__":
+    main()
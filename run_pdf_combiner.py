@@ -1,12 +1,11 @@
-from combinePDF import combine_pdfs
-from run_ai_request import make_ai_request
+from hospital_pdf.functions.combinePDF import merge_pdfs
+from hospital_pdf.functions.airequest import call_openai_live
 import argparse
 
 def main():
     # Set up argument parser
     parser = argparse.ArgumentParser(description='Combine PDFs and process with AI.')
-    parser.add_argument('pdf1', help='Path to the first PDF file')
-    parser.add_argument('pdf2', help='Path to the second PDF file')
+    parser.add_argument('inputs', nargs='+', help='Paths of the PDF files to combine, in order')
     parser.add_argument('output', help='Path for the output combined PDF')
     parser.add_argument('--model', default="gpt-3.5-turbo", 
                         help='The OpenAI model to use (default: gpt-3.5-turbo)')
@@ -18,7 +17,7 @@ def main():
 
     # First combine the PDFs
     print("Step 1: Combining PDFs...")
-    success = combine_pdfs(args.pdf1, args.pdf2, args.output)
+    success = merge_pdfs(args.inputs, args.output)
     
     if not success:
         print("PDF combination failed. Please check the error messages above.")
@@ -26,13 +25,13 @@ def main():
 
     # Now make the AI request
     print("\nStep 2: Processing with AI...")
-    prompt = f"I have combined two PDFs into one file at {args.output}. Please confirm this was successful."
+    prompt = f"I have combined {len(args.inputs)} PDFs into one file at {args.output}. Please confirm this was successful."
     
-    response = make_ai_request(prompt, args.model, args.temperature)
+    response = call_openai_live(prompt, "", model=args.model, temperature=args.temperature)
     
     if response:
         print("\nAI Confirmation:")
-        print(response.choices[0].message.content)
+        print(response)
     else:
         print("AI request failed. PDF combination was successful, but confirmation failed.")
         exit(1)